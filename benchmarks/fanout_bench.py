@@ -0,0 +1,211 @@
+"""Fan-out benchmark against a local stub danmuji fleet.
+
+Drives the real HttpRequestHandler and ConfigManager paths (full `-r` connect,
+`-c` config push, `-m` message burst) against an in-process stub listening on N
+ports. Reports throughput, p50/p95/p99 request latency, peak thread count and
+peak RSS for each fleet size, and saves everything as JSON so runs can be compared.
+
+    python benchmarks/fanout_bench.py --sizes 8,64,200,1000 --json fanout.json
+    python benchmarks/fanout_bench.py --latency 0.05 --jitter 0.05 --failure-rate 0.02 --compare fanout.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import threading
+import contextlib
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stub_server import StubDanmujiServer
+from src.config.settings import CONFIG
+from src.services.config_manager import ConfigManager
+from src.services.http_request_handler import HttpRequestHandler
+
+SCENARIOS = ('connect', 'config', 'message')
+
+class TimedHandler(HttpRequestHandler):
+    """HttpRequestHandler that records the latency and outcome of every request"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.samples = []
+
+    async def perform_request(self, url, method='get', data=None, headers=None):
+        started = time.perf_counter()
+        outcome = await super().perform_request(url, method, data, headers)
+        self.samples.append((time.perf_counter() - started, outcome.ok))
+        return outcome
+
+class ResourceSampler:
+    """Sample thread count and RSS in the background while a scenario runs"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss_bytes():
+        try:
+            with open('/proc/self/statm', 'r') as file:
+                return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def run_scenario(name, handler, config_manager, ports):
+    if name == 'connect':
+        handler.run_plans((port, handler.connect_steps(port, 12345, force=True)) for port in ports)
+    elif name == 'config':
+        args = argparse.Namespace(config='set-tofu-ad-on.json', time=None, force=True)
+        config_manager.process_config_command(handler, ports, args)
+    elif name == 'message':
+        config_manager.process_message_command(handler, ports, '+'.join(f'benchmark {i}' for i in range(len(ports))))
+
+def measure(name, size, args):
+    ports = list(range(args.base_port, args.base_port + size))
+    config = dict(CONFIG, ip_address='127.0.0.1', start_port=ports[0], end_port=ports[-1],
+                  topology_file=None, fleet_state_file=None, login_state_file=None,
+                  message_revert_delay=args.revert_delay)
+    dead = ports[:int(size * args.dead_fraction)]
+    runs = []
+    with StubDanmujiServer(ports, latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                           drop_rate=args.drop_rate, dead_ports=dead, seed=args.seed):
+        handler = TimedHandler(config)
+        config_manager = ConfigManager(config)
+        try:
+            for run in range(args.repeat):
+                handler.samples = []
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    with ResourceSampler() as sampler:
+                        started = time.perf_counter()
+                        run_scenario(name, handler, config_manager, ports)
+                        wall = time.perf_counter() - started
+                latencies = sorted(latency for latency, _ in handler.samples)
+                ok = sum(1 for _, success in handler.samples if success)
+                runs.append({
+                    'scenario': name,
+                    'fleet_size': size,
+                    'run': run,
+                    'wall_s': round(wall, 4),
+                    'requests': len(handler.samples),
+                    'ok': ok,
+                    'throughput_rps': round(ok / wall, 2) if wall else None,
+                    'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+                    'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+                    'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+                    'peak_threads': sampler.peak_threads,
+                    'peak_rss_mb': round(sampler.peak_rss / 2 ** 20, 1),
+                })
+        finally:
+            handler.close()
+    return runs
+
+def summarize(results):
+    """Median of each metric per (scenario, fleet size)"""
+    groups = {}
+    for result in results:
+        groups.setdefault((result['scenario'], result['fleet_size']), []).append(result)
+    summary = []
+    for (scenario, size), runs in groups.items():
+        row = {'scenario': scenario, 'fleet_size': size}
+        for key in ('wall_s', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_threads', 'peak_rss_mb'):
+            values = [run[key] for run in runs if run[key] is not None]
+            row[key] = statistics.median(values) if values else None
+        row['ok'] = sum(run['ok'] for run in runs)
+        row['requests'] = sum(run['requests'] for run in runs)
+        summary.append(row)
+    return summary
+
+def print_summary(summary, baseline=None):
+    previous = {(row['scenario'], row['fleet_size']): row for row in (baseline or [])}
+    print(f"{'scenario':<9}{'ports':>6}{'wall s':>9}{'ok/req':>12}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'threads':>8}{'rss MB':>8}" + ('   vs baseline' if previous else ''))
+    for row in summary:
+        def fmt(key, spec='.1f'):
+            return '-' if row[key] is None else format(row[key], spec)
+        line = (f"{row['scenario']:<9}{row['fleet_size']:>6}{fmt('wall_s', '.3f'):>9}"
+                f"{row['ok']:>6}/{row['requests']:<5}{fmt('throughput_rps', '.0f'):>9}{fmt('p50_ms'):>9}"
+                f"{fmt('p95_ms'):>9}{fmt('p99_ms'):>9}{fmt('peak_threads', '.0f'):>8}{fmt('peak_rss_mb'):>8}")
+        before = previous.get((row['scenario'], row['fleet_size']))
+        if before and before['throughput_rps'] and row['throughput_rps']:
+            line += f"   {(row['throughput_rps'] / before['throughput_rps'] - 1) * 100:+.1f}% req/s"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fleet fan-out against a local stub danmuji server.")
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')],
+                        default=[8, 24, 64, 200, 500, 1000], help='Comma separated fleet sizes (ports)')
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=list(SCENARIOS),
+                        help=f"Comma separated scenarios (default: {','.join(SCENARIOS)})")
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario and fleet size')
+    parser.add_argument('--base-port', type=int, default=24000, help='First port of the stub fleet (keep below the ephemeral range)')
+    parser.add_argument('--latency', type=float, default=0.01, help='Stub response latency (seconds)')
+    parser.add_argument('--jitter', type=float, default=0.01, help='Extra random stub latency (seconds)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Probability of a 500 response')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Probability of dropping the connection')
+    parser.add_argument('--dead-fraction', type=float, default=0.0, help='Fraction of ports that are not listening')
+    parser.add_argument('--revert-delay', type=float, default=0.2, help='Message advert revert delay (seconds)')
+    parser.add_argument('--seed', type=int, default=1, help='Stub random seed')
+    parser.add_argument('--json', type=str, help='Write raw runs and the summary to this JSON file')
+    parser.add_argument('--compare', type=str, help='Compare throughput against a previous JSON report')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    results = []
+    for name in args.scenarios:
+        for size in args.sizes:
+            results.extend(measure(name, size, args))
+
+    summary = summarize(results)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)['summary']
+    print_summary(summary, baseline)
+
+    if args.json:
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'params': {key: value for key, value in vars(args).items() if key not in ('json', 'compare')},
+            },
+            'summary': summary,
+            'runs': results,
+        }
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=4)
+
+if __name__ == "__main__":
+    main()
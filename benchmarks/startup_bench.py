@@ -0,0 +1,161 @@
+"""Startup latency benchmark for main.py.
+
+Measures the import profile of main.py and, for each CLI mode, the time from
+spawning the process to the first request reaching a local stub fleet. Cold runs
+use an empty bytecode cache; warm runs reuse it. Compare against a saved result
+with --baseline to catch startup regressions.
+
+    python benchmarks/startup_bench.py --json startup.json
+    python benchmarks/startup_bench.py --baseline startup.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stub_server import StubDanmujiServer
+
+# Run main.py with CONFIG pointed at the stub fleet
+LAUNCHER = (
+    "import sys, json, runpy;"
+    "from src.config.settings import CONFIG;"
+    "CONFIG.update(json.loads(sys.argv[1]));"
+    "sys.argv = ['main.py'] + sys.argv[2:];"
+    "runpy.run_path('main.py', run_name='__main__')"
+)
+
+MODES = {
+    'connect': ['-r', '12345'],
+    'disconnect': ['-d'],
+    'quiet': ['-q'],
+    'login': ['-l'],
+    'config': ['-c', 'set-default-idle.json'],
+    'message': ['-m', 'benchmark'],
+}
+
+def import_profile(top=10):
+    """Return the import time of main.py and its slowest direct imports (ms)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=ROOT, capture_output=True, text=True)
+    total_ms = None
+    modules = []
+    children = []
+    # -X importtime prints children before their parent, two spaces per level
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative) / 1000))
+        elif depth == 0:
+            if name.strip() == 'main':
+                total_ms = int(cumulative) / 1000
+                modules = children
+            children = []
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return {
+        'total_ms': total_ms,
+        'top': [{'module': name, 'ms': round(ms, 2)} for name, ms in modules[:top]],
+    }
+
+def time_to_first_request(server, config, mode_args, env):
+    """Spawn main.py and return (ms until the first request, ms until exit)"""
+    server.reset()
+    start = time.time()
+    process = subprocess.Popen([sys.executable, '-c', LAUNCHER, json.dumps(config)] + mode_args,
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    got_request = server.first_request.wait(timeout=30)
+    first = server.events[0][0] if got_request and server.events else None
+    process.wait()
+    end = time.time()
+    return (round((first - start) * 1000, 2) if first else None), round((end - start) * 1000, 2)
+
+def run(args):
+    ports = range(args.base_port, args.base_port + args.fleets * 8)
+    cookie_file = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False)
+    for i in range(len(ports)):
+        cookie_file.write(f"account{i}\nSESSDATA=bench{i}; bili_jct=bench{i}\n")
+    cookie_file.close()
+    config = {
+        'start_port': ports.start,
+        'end_port': ports.stop - 1,
+        'filename': cookie_file.name,
+        # 不保存登录和端口状态，否则热启动时的命令会因为已经一致而不发请求
+        'login_state_file': None,
+        'fleet_state_file': None,
+    }
+
+    report = {'python': sys.version.split()[0], 'imports': import_profile(), 'modes': {}}
+    try:
+        with StubDanmujiServer(ports) as server:
+            for name in args.modes:
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    cold_env = dict(os.environ, PYTHONPYCACHEPREFIX=cache_dir)
+                    cold_first, cold_exit = time_to_first_request(server, config, MODES[name], cold_env)
+                warm = [time_to_first_request(server, config, MODES[name], os.environ) for _ in range(args.repeat)]
+                report['modes'][name] = {
+                    'cold_first_request_ms': cold_first,
+                    'cold_exit_ms': cold_exit,
+                    'warm_first_request_ms': statistics.median(first for first, _ in warm),
+                    'warm_exit_ms': statistics.median(exit_ms for _, exit_ms in warm),
+                }
+    finally:
+        os.unlink(cookie_file.name)
+    return report
+
+def compare(report, baseline, tolerance):
+    """Return the modes whose warm time-to-first-request regressed past the tolerance"""
+    regressions = []
+    for name, result in report['modes'].items():
+        previous = baseline.get('modes', {}).get(name)
+        if not previous or previous['warm_first_request_ms'] is None or result['warm_first_request_ms'] is None:
+            continue
+        limit = previous['warm_first_request_ms'] * (1 + tolerance)
+        if result['warm_first_request_ms'] > limit:
+            regressions.append((name, previous['warm_first_request_ms'], result['warm_first_request_ms']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure main.py startup and time-to-first-request.")
+    parser.add_argument('--base-port', type=int, default=26000, help='First port of the stub fleet (keep below the ephemeral range)')
+    parser.add_argument('--fleets', type=int, default=3, help='Number of 8-port fleets to stub')
+    parser.add_argument('--repeat', type=int, default=5, help='Warm runs per mode')
+    parser.add_argument('--modes', type=lambda value: value.split(','), default=list(MODES),
+                        help=f"Comma separated modes (default: {','.join(MODES)})")
+    parser.add_argument('--json', type=str, help='Write the report to this JSON file')
+    parser.add_argument('--baseline', type=str, help='Compare against a previous JSON report')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    report = run(args)
+
+    print(f"Import main.py: {report['imports']['total_ms']:.1f} ms")
+    for item in report['imports']['top']:
+        print(f"  {item['module']:<40} {item['ms']:>8.1f} ms")
+    print(f"{'mode':<12}{'cold first':>12}{'warm first':>12}{'warm exit':>12}")
+    for name, result in report['modes'].items():
+        print(f"{name:<12}{result['cold_first_request_ms'] or 0:>10.1f}ms"
+              f"{result['warm_first_request_ms'] or 0:>10.1f}ms{result['warm_exit_ms']:>10.1f}ms")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for name, before, after in regressions:
+            print(f"Regression: {name} time-to-first-request {before:.1f} ms -> {after:.1f} ms")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import time
+import random
+import asyncio
+import threading
+from http import HTTPStatus
+
+class StubDanmujiServer:
+    """In-process stub of the danmuji HTTP API listening on a range of ports.
+
+    Every endpoint (/connectRoom, /disconnectRoom, /sendSet, /customCookie, /quit
+    and anything else) answers over keep-alive HTTP/1.1. Each request waits
+    `latency` plus up to `jitter` seconds, then fails with a 500 with probability
+    `failure_rate` or drops the connection with probability `drop_rate`. Ports in
+    `dead_ports` are never opened. Requests are recorded as
+    (arrival time, port, method, path, body bytes).
+    """
+
+    def __init__(self, ports, host='127.0.0.1', latency=0.0, jitter=0.0, failure_rate=0.0, drop_rate=0.0,
+                 dead_ports=(), seed=None):
+        self.ports = [port for port in ports if port not in set(dead_ports)]
+        self.host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.events = []
+        self.first_request = threading.Event()
+        self._loop = None
+        self._thread = None
+        self._servers = []
+        self._writers = set()
+
+    async def _respond(self, port, method, path, body):
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        roll = self.random.random()
+        if roll < self.drop_rate:
+            return None, b''
+        if roll < self.drop_rate + self.failure_rate:
+            return 500, b'{"code":500}'
+        return 200, b'{"code":200}'
+
+    async def _handle(self, reader, writer):
+        port = writer.get_extra_info('sockname')[1]
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b''):
+                        break
+                    name, _, value = header.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b''
+
+                path = target.split('?', 1)[0]
+                with self.lock:
+                    self.events.append((time.time(), port, method, path, len(body)))
+                self.first_request.set()
+
+                status, payload = await self._respond(port, method, path, body)
+                if status is None:
+                    # 模拟容器异常断开
+                    break
+                writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                             % (status, HTTPStatus(status).phrase.encode('ascii'), len(payload)) + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def start(self):
+        """Start listening on every port in a background event loop"""
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        async def listen():
+            for port in self.ports:
+                self._servers.append(await asyncio.start_server(self._handle, self.host, port, backlog=1024))
+
+        def run_loop():
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(listen())
+            except OSError as exc:
+                # 端口被占用等情况：关闭已打开的监听并把异常交给调用方
+                for server in self._servers:
+                    server.close()
+                self._loop.close()
+                errors.append(exc)
+                return
+            finally:
+                ready.set()
+            self._loop.run_forever()
+
+        errors = []
+        self._thread = threading.Thread(target=run_loop, name='stub-danmuji', daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def reset(self):
+        """Forget recorded requests"""
+        with self.lock:
+            self.events = []
+        self.first_request.clear()
+
+    def stop(self):
+        """Close every listener and stop the loop"""
+        async def close():
+            for server in self._servers:
+                server.close()
+            for writer in list(self._writers):
+                writer.close()
+            for server in self._servers:
+                await server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
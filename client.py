@@ -0,0 +1,23 @@
+import sys
+import argparse
+from src.config.settings import CONFIG
+from src.core.daemon_client import send_command, stop_daemon
+
+def main():
+    # Thin client for `main.py --daemon`: forwards the arguments and relays output
+    parser = argparse.ArgumentParser(description="Run main.py commands on a running fleet daemon.",
+                                     add_help=False, allow_abbrev=False)
+    parser.add_argument('--socket', type=str, default=CONFIG['socket_path'],
+                        help='Unix socket path of the daemon (the --socket it was started with)')
+    parser.add_argument('--stop', action='store_true', help='Stop the daemon')
+    args, argv = parser.parse_known_args()
+    try:
+        if args.stop:
+            sys.exit(stop_daemon(args.socket))
+        sys.exit(send_command(args.socket, argv))
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"Error: no daemon listening on {args.socket}, start one with `python main.py --daemon --socket {args.socket}`.", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
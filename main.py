@@ -1,3 +1,4 @@
+import sys
 from src.core.room_manager import RoomManager
 from src.core.fleet_manager import FleetManager
 from src.services.http_request_handler import HttpRequestHandler
@@ -14,7 +15,7 @@ def main():
     
     # Create and run the application
     app = BiliLiveApp(room_manager, fleet_manager, http_handler, config_manager)
-    app.run()
+    sys.exit(app.run())
 
 if __name__ == "__main__":
     main()
@@ -4,5 +4,32 @@ CONFIG = {
     'start_port': 23330,
     'end_port': 23353,
     'filename': 'cookies.txt',
-    'fleet_size': 8
+    'login_state_file': 'login-state.json',
+    'login_state_ttl': 6 * 3600,
+    'fleet_state_file': 'fleet-state.json',
+    'fleet_state_ttl': 6 * 3600,
+    'fleet_size': 8,
+    'topology_file': 'topology.json',
+    'container_port': 23333,
+    'max_in_flight': 256,
+    'pool_size': 4,
+    'connect_timeout': 3,
+    'read_timeout': 10,
+    'probe_timeout': 1,
+    'breaker_failures': 3,
+    'breaker_reset': 30,
+    'host_initial_concurrency': 32,
+    'host_min_concurrency': 2,
+    'host_max_concurrency': 256,
+    'target_latency': 1.0,
+    'max_retries': 2,
+    'retry_backoff': 0.2,
+    'retry_backoff_max': 2.0,
+    'message_revert_delay': 5,
+    'message_rate': 0.5,
+    'message_burst': 3,
+    'message_batch': 3,
+    'watch_debounce': 0.5,
+    'watch_poll_interval': 1.0,
+    'socket_path': 'danmuji-fleet.sock'
 } 
\ No newline at end of file
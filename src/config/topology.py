@@ -0,0 +1,114 @@
+import os
+import re
+import json
+from collections import namedtuple
+
+class Endpoint(namedtuple('Endpoint', ['host', 'port'])):
+    """One danmuji container reachable at host:port"""
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+    def __format__(self, spec):
+        return format(str(self), spec)
+
+# 匹配 docker-compose.yml 中的端口映射，例如 - "127.0.0.1:23330:23333"
+COMPOSE_PORT_PATTERN = re.compile(r'^\s*-\s*["\']?(?:([\d.]+):)?(\d+):(\d+)(?:/tcp)?["\']?\s*$')
+
+class Topology:
+    """Map fleet numbers to danmuji endpoints spread over one or more hosts"""
+
+    def __init__(self, fleets):
+        self.fleets = fleets
+
+    @staticmethod
+    def chunk(endpoints, fleet_size, first_fleet=1):
+        """Split endpoints into consecutive fleets of fleet_size"""
+        return {first_fleet + i // fleet_size: endpoints[i:i + fleet_size]
+                for i in range(0, len(endpoints), fleet_size)}
+
+    @classmethod
+    def from_config(cls, config):
+        """Legacy layout: contiguous port slices on config['ip_address']"""
+        endpoints = [Endpoint(config['ip_address'], port)
+                     for port in range(config['start_port'], config['end_port'] + 1)]
+        return cls(cls.chunk(endpoints, config['fleet_size']))
+
+    @staticmethod
+    def compose_endpoints(path, host, container_port=23333):
+        """Read the published danmuji ports from a docker-compose.yml, in service order"""
+        endpoints = []
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                match = COMPOSE_PORT_PATTERN.match(line)
+                if match and int(match.group(3)) == container_port:
+                    endpoints.append(Endpoint(host, int(match.group(2))))
+        return endpoints
+
+    @classmethod
+    def from_compose(cls, path, config):
+        """Derive fleets from the port mappings of a single-host docker-compose.yml"""
+        endpoints = cls.compose_endpoints(path, config['ip_address'], config.get('container_port', 23333))
+        return cls(cls.chunk(endpoints, config['fleet_size']))
+
+    @classmethod
+    def from_file(cls, path, config):
+        """Load a topology file.
+
+        Either explicit fleets, {"fleets": {"1": ["10.0.0.2:23330", ...]}}, or hosts
+        whose ports are chunked into fleets in order:
+        {"fleet_size": 8, "hosts": [{"host": "10.0.0.2", "ports": "23330-23353"},
+                                   {"host": "10.0.0.3", "compose": "docker-compose.yml"}]}
+        """
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+
+        if 'fleets' in data:
+            fleets = {}
+            for fleet_num, addresses in data['fleets'].items():
+                fleets[int(fleet_num)] = [Endpoint(address.rsplit(':', 1)[0], int(address.rsplit(':', 1)[1]))
+                                          for address in addresses]
+            return cls(fleets)
+
+        fleet_size = data.get('fleet_size', config['fleet_size'])
+        fleets = {}
+        for entry in data.get('hosts', []):
+            host = entry['host']
+            if 'compose' in entry:
+                compose_path = os.path.join(os.path.dirname(os.path.abspath(path)), entry['compose'])
+                endpoints = cls.compose_endpoints(compose_path, host, entry.get('container_port', 23333))
+            else:
+                start, _, end = str(entry['ports']).partition('-')
+                endpoints = [Endpoint(host, port) for port in range(int(start), int(end or start) + 1)]
+            # 每台主机的舰队编号接着上一台主机继续
+            fleets.update(cls.chunk(endpoints, entry.get('fleet_size', fleet_size), len(fleets) + 1))
+        return cls(fleets)
+
+    @classmethod
+    def load(cls, config, path=None):
+        """Load the topology from a file (.json or docker-compose .yml), or fall back to CONFIG.
+
+        Only a missing default topology_file falls back; an explicit path must exist.
+        """
+        if path and not os.path.exists(path):
+            raise FileNotFoundError(f"topology file '{path}' does not exist")
+        path = path or config.get('topology_file')
+        if path and os.path.exists(path):
+            if path.endswith(('.yml', '.yaml')):
+                return cls.from_compose(path, config)
+            return cls.from_file(path, config)
+        return cls.from_config(config)
+
+    def fleet_numbers(self):
+        return sorted(self.fleets)
+
+    def endpoints(self, fleet_nums=None):
+        """Return the endpoints of the given fleets (all fleets if empty)"""
+        endpoints = []
+        for num in fleet_nums or self.fleet_numbers():
+            endpoints.extend(self.fleets.get(num, []))
+        return endpoints
+
+    def hosts(self):
+        return sorted({endpoint.host for endpoint in self.endpoints()})
@@ -6,50 +6,134 @@ class BiliLiveApp:
         self.fleet_manager = fleet_manager
         self.http_handler = http_handler
         self.config_manager = config_manager
+        # 守护进程模式下不能弹出交互式选择
+        self.interactive = True
     
-    def parse_arguments(self):
+    def parse_arguments(self, argv=None):
         parser = argparse.ArgumentParser(description="Control connection operations.")
         parser.add_argument('-d', '--disconnect', action='store_true', help='Only send disconnect requests')
         parser.add_argument('-q', '--quiet', action='store_true', help='Send /quit GET request to all ports')
         parser.add_argument('-l', '--login', action='store_true', help='Send login requests with cookies data to ports')
+        parser.add_argument('--force', action='store_true',
+                           help='Push configs and reconnect rooms even if fleet-state.json says they are already applied')
+        parser.add_argument('--force-login', action='store_true', help='With -l, push cookies to every port even if already logged in')
         parser.add_argument('-c', '--config', type=str, nargs='?', const=None, default=-1, 
                            help='Configuration file path. Options: filepath.json or empty (interactive)')
         parser.add_argument('-t', '--time', type=int, help='Sleep time before loading default configuration (seconds)')
         parser.add_argument('-m', '--message', type=str, help='Store a custom message')
-        parser.add_argument('-r', '--room', type=int, help='Directly connect to a specific room ID')
+        parser.add_argument('-r', '--room', type=str,
+                           help='Directly connect to a room, by room ID or by remark in room_ids.json (prefix/fuzzy match)')
+        parser.add_argument('--rooms', type=str,
+                           help='Connect several rooms in one run, e.g. "12345:1,2;晚风:3-4" (room ID or remark, then fleets)')
+        parser.add_argument('--room-plan', type=str,
+                           help='Room to fleets plan file: {"rooms": [{"room": "晚风", "fleets": [1, 2]}, {"room": "12345"}]}')
+        parser.add_argument('--balance', action='store_true',
+                           help='With --rooms/--room-plan, spread the fleets selected by -f over the rooms automatically')
         parser.add_argument('-f', '--fleet', type=str, default='0', help='Specify fleet numbers to use (e.g., "1,2,3"). Default: all fleets')
-        return parser.parse_args()
+        parser.add_argument('--topology', type=str,
+                           help='Fleet topology file (topology.json or docker-compose.yml). Default: CONFIG topology_file or port range')
+        parser.add_argument('-v', '--verbose', action='store_true', help='Print every response, not only failures and summaries')
+        parser.add_argument('--jsonl', type=str, help='Append one JSON line per request result to this file')
+        parser.add_argument('--metrics', type=str, help="Write Prometheus text metrics to this file after the command ('-' for stdout)")
+        parser.add_argument('--health', action='store_true', help='Probe every port and print a fleet health report')
+        parser.add_argument('--watch', action='store_true',
+                           help='After applying -c/-r, watch config/ and room_ids.json and push edits to the ports using them')
+        parser.add_argument('--daemon', action='store_true', help='Run as a long-lived fleet daemon listening on a Unix socket')
+        parser.add_argument('--socket', type=str, default=self.config_manager.config['socket_path'],
+                           help='Unix socket path used by --daemon')
+        return parser.parse_args(argv)
     
     def get_fleet_nums(self, args):
         """根据命令行参数获取 fleet numbers，不再提示用户输入"""
         fleet_nums_input = args.fleet
-        total_fleets = (self.config_manager.config['end_port'] - self.config_manager.config['start_port'] + 1) // self.config_manager.config['fleet_size']
         
         # 如果指定了 '0' 或空字符串，使用所有 fleets
         if not fleet_nums_input or fleet_nums_input == '0':
-            return list(range(1, total_fleets + 1))
+            return self.fleet_manager.all_fleet_nums()
         
         # 否则解析指定的 fleets
         try:
             return [int(num.strip()) for num in fleet_nums_input.split(',')]
         except ValueError:
             print(f"警告：无效的舰队编号 '{fleet_nums_input}'，使用所有舰队代替。")
-            return list(range(1, total_fleets + 1))
+            return self.fleet_manager.all_fleet_nums()
     
-    def run(self):
-        args = self.parse_arguments()
+    def run(self, argv=None):
+        args = self.parse_arguments(argv)
+        
+        if args.daemon:
+            from src.core.daemon import FleetDaemon
+            FleetDaemon(self, args.socket).serve_forever()
+            return 0
+        
+        return self.execute(args)
+    
+    def execute(self, args):
+        """Execute one parsed command against the fleet and return its exit code.
+
+        Results, -v/--jsonl and --topology are scoped to this command, so commands
+        running side by side in the daemon do not see each other's.
+        """
+        topology = None
+        if args.topology:
+            try:
+                topology = self.fleet_manager.load_topology(args.topology)
+            except FileNotFoundError as e:
+                print(f"Error: {e}.")
+                return 2
+        with self.http_handler.command(args.verbose, args.jsonl), self.fleet_manager.using_topology(topology):
+            try:
+                return self.dispatch_command(args) or 0
+            finally:
+                self.http_handler.report_results()
+                if args.metrics:
+                    self.http_handler.dump_metrics(args.metrics)
+    
+    def dispatch_command(self, args):
+        """Run the command; usage errors return 2 and unresolved rooms return 1"""
+        if args.config is None and not self.interactive:
+            print("Error: interactive config selection is not available in daemon mode, pass -c <file>.")
+            return 2
         
         # 获取 fleet_nums，避免用户输入
         fleet_nums = self.get_fleet_nums(args)
-        ports = self.fleet_manager.calculate_ports(fleet_nums)
+        other_action = args.quiet or args.disconnect or args.login or args.message or args.health
         
-        # 处理配置和等待时间
+        # 多房间分配：每个端口连接到自己舰队对应的房间
+        rooms = None
+        if args.rooms or args.room_plan:
+            rooms = self.resolve_room_assignment(args, fleet_nums)
+            if not rooms:
+                return 1
+            ports = list(rooms)
+        else:
+            ports = self.fleet_manager.calculate_ports(fleet_nums)
+            # 直接使用命令行传入的房间号，或按备注在 room_ids.json 中查找
+            if args.room and not other_action:
+                room_id = self.room_manager.resolve_room(args.room)
+                if room_id is None:
+                    return 1
+                rooms = {port: room_id for port in ports}
+        
+        # 处理配置和等待时间，指定了房间时连接房间和推送配置在同一个逐端口计划中完成
         config_processed = False
         if args.config != -1:
-            config_processed = self.config_manager.process_config_command(self.http_handler, ports, args)
+            config_processed = self.config_manager.process_config_command(self.http_handler, ports, args, rooms)
+        
+        # 监视模式：先应用 -c/-r，然后把 config/ 和 room_ids.json 的修改推送给受影响的端口
+        if args.watch:
+            if not self.interactive:
+                print("Error: --watch is not available in daemon mode.")
+                return 2
+            if rooms and not config_processed:
+                self.http_handler.run_plans((port, self.http_handler.connect_steps(port, room_id, args.force))
+                                           for port, room_id in rooms.items())
+            self.config_manager.watch(self.http_handler, ports, self.room_manager.filename,
+                                      lambda: self.resolve_rooms(args, fleet_nums, ports))
+            return
         
         # 如果只处理配置，没有其他操作，则退出
-        if config_processed and not args.room and not args.quiet and not args.disconnect and not args.login and not args.message:
+        if config_processed and not other_action:
             return
         
         # Handle message command
@@ -57,29 +141,72 @@ class BiliLiveApp:
             self.config_manager.process_message_command(self.http_handler, ports, args.message)
             return
         
+        # Handle health report
+        if args.health:
+            self.http_handler.check_health(ports)
+            return
+        
         # Handle quiet command
         if args.quiet:
+            self.http_handler.fleet_state.forget(ports)
+            self.http_handler.fleet_state.flush()
+            self.http_handler.login_state.forget(ports)
+            self.http_handler.login_state.flush()
             self.http_handler.process_requests(ports, "quiet")
             return
         
         # Handle disconnect command
         if args.disconnect:
-            self.http_handler.process_requests(ports, "disconnectRoom")
+            self.http_handler.run_plans((port, self.http_handler.disconnect_steps(port)) for port in ports)
             return
         
         # Handle login command
         if args.login:
-            self.http_handler.send_cookie_requests(self.config_manager.config['filename'], ports)
+            self.http_handler.send_cookie_requests(self.config_manager.config['filename'], ports, args.force_login)
             return
         
         # Default flow: connect to a room
-        if args.room:
-            # 直接使用命令行传入的房间号
-            room_id = args.room
-        else:
+        if rooms is None:
+            if not self.interactive:
+                print("Error: a room ID (-r) is required in daemon mode.")
+                return 2
             # 如果没有直接指定房间号，则使用交互式界面让用户选择
             room_id = self.room_manager.get_user_choice()
+            rooms = {port: room_id for port in ports}
             
-        # 无论通过哪种方式获取房间号，都执行相同的连接逻辑
-        self.http_handler.process_requests(ports, "disconnectRoom")
-        self.http_handler.process_requests(ports, "connectRoom", f"roomid={room_id}") 
\ No newline at end of file
+        # 无论通过哪种方式获取房间号，都执行相同的连接逻辑：每个端口独立地先断开再连接
+        self.http_handler.run_plans((port, self.http_handler.connect_steps(port, room_id, args.force))
+                                   for port, room_id in rooms.items())
+    
+    def resolve_rooms(self, args, fleet_nums, ports):
+        """重新解析 -r / --rooms / --room-plan，返回 {端点: room_id}，没有指定房间时返回 None"""
+        if args.rooms or args.room_plan:
+            return self.resolve_room_assignment(args, fleet_nums)
+        if args.room:
+            room_id = self.room_manager.resolve_room(args.room)
+            if room_id is not None:
+                return {port: room_id for port in ports}
+        return None
+    
+    def resolve_room_assignment(self, args, fleet_nums):
+        """把 --rooms / --room-plan 解析成 {端点: room_id}，房间可以是房间号或 room_ids.json 中的备注"""
+        if args.room:
+            print("Error: -r cannot be combined with --rooms or --room-plan.")
+            return None
+        
+        balance = args.balance
+        if args.room_plan:
+            assignments, plan_balance = self.fleet_manager.load_room_plan(args.room_plan)
+            balance = balance or plan_balance
+        else:
+            assignments = []
+        if args.rooms:
+            assignments += self.fleet_manager.parse_room_spec(args.rooms)
+        
+        resolved = []
+        for query, fleets in assignments:
+            room_id = self.room_manager.resolve_room(query)
+            if room_id is None:
+                return None
+            resolved.append((room_id, fleets))
+        return dict(self.fleet_manager.assign_rooms(resolved, fleet_nums, balance))
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import socket
+import threading
+import contextvars
+import socketserver
+
+# 当前命令的 SocketWriter；命令在引擎循环上启动的任务也会继承它
+command_output = contextvars.ContextVar('command_output', default=None)
+
+class SocketWriter:
+    """File-like object that streams command output back to the client"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        if text:
+            self.send({'output': text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def send(self, message):
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        with self.lock:
+            try:
+                self.connection.sendall(data)
+            except OSError:
+                # 客户端已断开，命令继续执行
+                pass
+
+class CommandOutput:
+    """Stand-in for sys.stdout/sys.stderr that sends output to the client of the command printing it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def target(self):
+        return command_output.get() or self.stream
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class FleetDaemon:
+    """Keep BiliLiveApp warm and run CLI commands received over a Unix socket.
+
+    Each request is one JSON line: {"argv": [...]} runs the arguments exactly as
+    main.py would, {"shutdown": true} stops the daemon. Output is streamed back
+    as {"output": ...} lines followed by a final {"exit": code}. Commands run
+    side by side, so a long -t or -m wait does not hold up other clients.
+    """
+
+    def __init__(self, app, socket_path):
+        self.app = app
+        self.socket_path = socket_path
+        self.server = None
+
+    def handle_connection(self, connection):
+        writer = SocketWriter(connection)
+        line = connection.makefile('rb').readline()
+        try:
+            request = json.loads(line)
+        except ValueError:
+            writer.send({'exit': 2, 'error': 'Invalid request.'})
+            return
+
+        if request.get('shutdown'):
+            writer.send({'exit': 0})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+
+        writer.send({'exit': self.run_command(request.get('argv', []), writer)})
+
+    def run_command(self, argv, writer):
+        """Run one command with its output sent to the client"""
+        token = command_output.set(writer)
+        try:
+            args = self.app.parse_arguments(argv)
+            if args.daemon:
+                print("Error: the daemon is already running.")
+                return 2
+            return self.app.execute(args)
+        except SystemExit as exc:
+            return exc.code if isinstance(exc.code, int) else (0 if exc.code is None else 1)
+        except Exception as exc:
+            print(f"Command failed: {exc}")
+            return 1
+        finally:
+            command_output.reset(token)
+
+    def remove_stale_socket(self):
+        """Remove a socket file left behind by a daemon that is no longer running"""
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+        else:
+            raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    def serve_forever(self):
+        daemon = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                daemon.handle_connection(self.request)
+
+        self.app.interactive = False
+        self.remove_stale_socket()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = CommandOutput(stdout), CommandOutput(stderr)
+        with socketserver.ThreadingUnixStreamServer(self.socket_path, Handler) as server:
+            self.server = server
+            os.chmod(self.socket_path, 0o600)
+            print(f"Fleet daemon listening on {self.socket_path}", file=sys.stderr)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.unlink(self.socket_path)
+                self.app.http_handler.close()
+                sys.stdout, sys.stderr = stdout, stderr
+                print("Fleet daemon stopped.", file=sys.stderr)
@@ -0,0 +1,28 @@
+import sys
+import json
+import socket
+
+def send_request(socket_path, request):
+    """Send one request to the fleet daemon, relaying its output, and return the exit code"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        for line in connection.makefile('rb'):
+            message = json.loads(line)
+            if 'output' in message:
+                sys.stdout.write(message['output'])
+                sys.stdout.flush()
+            if 'exit' in message:
+                if message.get('error'):
+                    print(message['error'], file=sys.stderr)
+                return message['exit']
+    print("Error: the daemon closed the connection.", file=sys.stderr)
+    return 1
+
+def send_command(socket_path, argv):
+    """Run main.py arguments on the daemon"""
+    return send_request(socket_path, {'argv': argv})
+
+def stop_daemon(socket_path):
+    """Ask the daemon to shut down"""
+    return send_request(socket_path, {'shutdown': True})
@@ -1,26 +1,136 @@
+import json
 import threading
+import contextlib
+import contextvars
+from src.config.topology import Topology
 
 class FleetManager:
-    def __init__(self, config):
+    def __init__(self, config, topology=None):
         self.config = config
         self.lock = threading.Lock()
+        self.default_topology = topology or Topology.load(config)
+        # --topology 只对当前命令生效，守护进程中同时运行的其他命令仍使用默认布局
+        self._topology = contextvars.ContextVar('topology', default=None)
+    
+    @property
+    def topology(self):
+        return self._topology.get() or self.default_topology
+    
+    def load_topology(self, path):
+        """读取拓扑文件（topology.json 或 docker-compose.yml），文件不存在时抛出 FileNotFoundError"""
+        return Topology.load(self.config, path)
+    
+    @contextlib.contextmanager
+    def using_topology(self, topology):
+        """在当前命令中使用另一个 fleet 布局，None 表示默认布局"""
+        token = self._topology.set(topology)
+        try:
+            yield
+        finally:
+            self._topology.reset(token)
+    
+    def all_fleet_nums(self):
+        """返回拓扑中所有的 fleet 编号"""
+        return self.topology.fleet_numbers()
     
     def get_fleet_nums(self):
         """获取用户想要调度的 fleet 数量列表。如果输入为0或为空，则返回所有 fleets。"""
         fleet_nums_input = input("Enter the fleet numbers to dispatch (e.g., '1,2,3'), or '0' for all fleets: ")
         if not fleet_nums_input or fleet_nums_input == '0':  # 检查是否为空或为'0'
-            total_fleets = (self.config['end_port'] - self.config['start_port'] + 1) // self.config['fleet_size']
-            return list(range(1, total_fleets + 1))  # 返回所有可能的 fleet 编号
+            return self.all_fleet_nums()  # 返回所有可能的 fleet 编号
         fleet_nums = [int(num.strip()) for num in fleet_nums_input.split(',')]
         return fleet_nums
 
     def calculate_ports(self, fleet_nums):
-        """计算多个 fleet 对应的端口范围。"""
+        """计算多个 fleet 对应的端点（host, port），fleet 可以分布在多台主机上。"""
         if not fleet_nums or fleet_nums == '0':
-            fleet_nums = list(range(1, (self.config['end_port'] - self.config['start_port'] + 1) // self.config['fleet_size'] + 1))
+            fleet_nums = self.all_fleet_nums()
+        unknown = [num for num in fleet_nums if num not in self.topology.fleets]
+        if unknown:
+            with self.lock:
+                print(f"警告：舰队编号 {unknown} 不在拓扑中，已忽略。")
+        return self.topology.endpoints(fleet_nums)
+
+    @staticmethod
+    def parse_fleet_list(text):
+        """解析舰队列表，例如 1,2 或 1-3,5"""
+        fleet_nums = []
+        for part in str(text).split(','):
+            start, _, end = part.strip().partition('-')
+            fleet_nums.extend(range(int(start), int(end or start) + 1))
+        return fleet_nums
+
+    def parse_room_spec(self, spec):
+        """解析 --rooms，例如 "晚风:1,2;1916502068:3-4;苦瓜"，返回 [(房间, fleet 列表或 None)]"""
+        assignments = []
+        for entry in spec.split(';'):
+            entry = entry.strip()
+            if not entry:
+                continue
+            room, _, fleets = entry.rpartition(':')
+            # 备注里可能带冒号，只有冒号后面是舰队列表时才拆开
+            if room and fleets.replace(',', '').replace('-', '').replace(' ', '').isdigit():
+                assignments.append((room.strip(), self.parse_fleet_list(fleets)))
+            else:
+                assignments.append((entry, None))
+        return assignments
+
+    def load_room_plan(self, path):
+        """读取房间分配计划文件，返回 ([(房间, fleet 列表或 None)], balance)
+
+        {"rooms": [{"room": "晚风甜酒", "fleets": [1, 2]}, {"room": "1916502068", "fleets": "3-4"},
+                   {"room": "苦瓜"}], "balance": true}
+        """
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        assignments = []
+        for entry in data.get('rooms', []):
+            fleets = entry.get('fleets')
+            if isinstance(fleets, str):
+                fleets = self.parse_fleet_list(fleets)
+            assignments.append((str(entry['room']), fleets))
+        return assignments, data.get('balance', False)
+
+    def assign_rooms(self, assignments, fleet_nums, balance=False):
+        """把 [(room_id, fleet 列表或 None)] 解析成一组 [(端点, room_id)]
+
+        每个舰队只能分配给一个房间。使用 balance 时，fleet_nums 中剩下的舰队会依次分给
+        当前端口最少的房间（优先分给没有指定舰队的房间）。
+        """
+        fleets_by_room = {}
+        owner = {}
+        for room_id, fleets in assignments:
+            fleets_by_room.setdefault(room_id, [])
+            for num in fleets or []:
+                if num not in self.topology.fleets:
+                    with self.lock:
+                        print(f"警告：舰队编号 {num} 不在拓扑中，已忽略。")
+                elif num in owner and owner[num] != room_id:
+                    with self.lock:
+                        print(f"警告：舰队 {num} 已分配给房间 {owner[num]}，忽略房间 {room_id} 的重复分配。")
+                elif num not in owner:
+                    owner[num] = room_id
+                    fleets_by_room[room_id].append(num)
+
+        if balance:
+            unassigned = [room_id for room_id, fleets in fleets_by_room.items() if not fleets]
+            targets = unassigned or list(fleets_by_room)
+            sizes = {room_id: len(self.topology.endpoints(fleets_by_room[room_id])) for room_id in targets}
+            for num in fleet_nums or self.all_fleet_nums():
+                if num in owner or num not in self.topology.fleets:
+                    continue
+                room_id = min(targets, key=lambda room: sizes[room])
+                owner[num] = room_id
+                fleets_by_room[room_id].append(num)
+                sizes[room_id] += len(self.topology.fleets[num])
+
         ports = []
-        for num in fleet_nums:
-            start_port = self.config['start_port'] + (num - 1) * self.config['fleet_size']
-            end_port = start_port + self.config['fleet_size'] - 1
-            ports.extend(range(start_port, end_port + 1))
-        return ports 
\ No newline at end of file
+        with self.lock:
+            for room_id, fleets in fleets_by_room.items():
+                if not fleets:
+                    print(f"警告：房间 {room_id} 没有分配到舰队" + ("。" if balance else "，可以使用 --balance 自动分配。"))
+                    continue
+                endpoints = self.topology.endpoints(sorted(fleets))
+                print(f"房间 {room_id}：舰队 {sorted(fleets)}（{len(endpoints)} 个端口）")
+                ports.extend((endpoint, room_id) for endpoint in endpoints)
+        return ports
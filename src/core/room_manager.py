@@ -1,41 +1,68 @@
-import os
-import json
-import threading
-import inquirer
+from src.core.room_registry import RoomRegistry
 
 class RoomManager:
+    NEW_ROOM_CHOICE = "Enter a new room ID with remark"
+
     def __init__(self, filename="room_ids.json"):
         self.filename = filename
-        self.lock = threading.Lock()
-    
+        self.registry = RoomRegistry(filename)
+        self._choices = None
+        self._choices_version = None
+
     def save_room_data(self, room_data):
-        with self.lock:
-            with open(self.filename, "w") as file:
-                json.dump(room_data, file, indent=4)
-    
+        self.registry.replace(room_data)
+
     def load_room_data(self):
-        with self.lock:
-            if not os.path.exists(self.filename):
-                return []
-            with open(self.filename, "r") as file:
-                return json.load(file)
+        return self.registry.rooms()
+
+    def resolve_room(self, query):
+        """Resolve -r to a room ID: digits are used as-is, anything else is looked up by remark.
+
+        Only an exact remark or a unique remark prefix is accepted. Substring and
+        fuzzy matches are printed as suggestions, and None is returned, as it is
+        for unknown or ambiguous remarks.
+        """
+        query = str(query).strip()
+        if query.isdigit():
+            return int(query)
+        matches, exact = self.registry.find(query)
+        if exact and len(matches) == 1:
+            return int(matches[0]['room_id'])
+        if not matches:
+            print(f"Error: no room matches '{query}'.")
+            return None
+        if exact:
+            print(f"Error: '{query}' matches several rooms, pass the room ID or a longer remark:")
+        else:
+            print(f"Error: no room remark starts with '{query}', did you mean:")
+        for room in matches:
+            print(f"  {room['room_id']} ({room['remark']})")
+        return None
+
+    def get_choices(self):
+        # 房间列表只在 room_ids.json 变化后重建
+        version = self.registry.version
+        if self._choices is None or version != self._choices_version:
+            self._choices = [f"{item['room_id']} ({item['remark']})" for item in self.registry.rooms()] + [self.NEW_ROOM_CHOICE]
+            self._choices_version = version
+        return self._choices
 
     def get_user_choice(self):
-        room_data = self.load_room_data()
-        choices = [f"{item['room_id']} ({item['remark']})" for item in room_data] + ["Enter a new room ID with remark"]
+        # 只有交互式选择才需要 inquirer，延迟导入以加快非交互命令的启动
+        import inquirer
+        choices = self.get_choices()
         questions = [inquirer.List('choice', message="Choose a room ID or add new one with remark", choices=choices)]
         answer = inquirer.prompt(questions)
         selected = answer['choice']
-        
-        if selected == "Enter a new room ID with remark":
+
+        if selected == self.NEW_ROOM_CHOICE:
             while True:
                 room_id = input("Enter new room ID: ")
-                if room_id.isdigit(): 
+                if room_id.isdigit():
                     remark = input("Enter remark for this room ID: ")
-                    room_data.append({"room_id": int(room_id), "remark": remark})
-                    self.save_room_data(room_data)
+                    self.registry.add(room_id, remark)
                     return int(room_id)
                 else:
                     print("Error: Room ID must be a number.")
         else:
-            return int(selected.split(" ")[0]) 
\ No newline at end of file
+            return int(selected.split(" ")[0])
@@ -0,0 +1,152 @@
+import os
+import json
+import bisect
+import difflib
+import threading
+from src.utils.atomic_file import write_atomic
+
+class RoomRegistry:
+    """In-memory index of room_ids.json by room ID and remark.
+
+    The file is parsed again only when its mtime or size changes. Room IDs are
+    indexed as strings; entries read from the file are written back exactly as
+    they were, so a save never rewrites rooms it did not change. Each entry's
+    serialized form is cached, so saving after an add only encodes the new room.
+    The file is replaced atomically.
+    """
+
+    def __init__(self, filename="room_ids.json"):
+        self.filename = filename
+        self.lock = threading.RLock()
+        self._version = None
+        self._rooms = []
+        self._by_id = {}
+        self._by_remark = {}
+        self._remark_keys = []
+        self._fragments = {}
+        self._entries = {}
+
+    @staticmethod
+    def normalize(room):
+        return {'room_id': str(room['room_id']).strip(), 'remark': room.get('remark', '')}
+
+    @staticmethod
+    def remark_key(remark):
+        return remark.strip().casefold()
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _index(self, rooms):
+        self._rooms = rooms
+        self._by_id = {room['room_id']: room for room in rooms}
+        self._by_remark = {}
+        for room in rooms:
+            self._by_remark.setdefault(self.remark_key(room['remark']), []).append(room)
+        self._remark_keys = sorted(self._by_remark)
+
+    def refresh(self):
+        """Reload the file if it changed since the last read"""
+        with self.lock:
+            version = self._file_version()
+            if version == self._version and self._version is not None:
+                return
+            entries = []
+            if version is not None:
+                with open(self.filename, "r", encoding="utf-8") as file:
+                    entries = json.load(file)
+            rooms = [self.normalize(entry) for entry in entries]
+            self._index(rooms)
+            self._fragments = {}
+            self._entries = {room['room_id']: entry for room, entry in zip(rooms, entries)}
+            self._version = version
+
+    def rooms(self):
+        """Return every room as {'room_id': str, 'remark': str}, in file order"""
+        with self.lock:
+            self.refresh()
+            return list(self._rooms)
+
+    @property
+    def version(self):
+        with self.lock:
+            self.refresh()
+            return self._version
+
+    def get(self, room_id):
+        with self.lock:
+            self.refresh()
+            return self._by_id.get(str(room_id))
+
+    def find(self, query, limit=10):
+        """Find rooms by ID, exact remark, remark prefix, substring, then fuzzy match.
+
+        Returns (matches, exact). exact is False for substring and fuzzy matches,
+        which are only suggestions.
+        """
+        with self.lock:
+            self.refresh()
+            query = str(query).strip()
+            if query in self._by_id:
+                return [self._by_id[query]], True
+
+            key = self.remark_key(query)
+            if key in self._by_remark:
+                return list(self._by_remark[key]), True
+
+            matches = []
+            start = bisect.bisect_left(self._remark_keys, key)
+            for remark_key in self._remark_keys[start:]:
+                if not remark_key.startswith(key):
+                    break
+                matches.extend(self._by_remark[remark_key])
+            if matches:
+                return matches[:limit], True
+
+            matches = [room for remark_key in self._remark_keys if key in remark_key
+                       for room in self._by_remark[remark_key]]
+            if not matches:
+                for remark_key in difflib.get_close_matches(key, self._remark_keys, n=limit, cutoff=0.6):
+                    matches.extend(self._by_remark[remark_key])
+            return matches[:limit], False
+
+    def _fragment(self, room):
+        fragment = self._fragments.get(room['room_id'])
+        if fragment is None:
+            body = json.dumps(self._entries.get(room['room_id'], room), indent=4)
+            fragment = self._fragments[room['room_id']] = '    ' + body.replace('\n', '\n    ')
+        return fragment
+
+    def save(self):
+        """Write the registry back atomically"""
+        with self.lock:
+            text = '[\n' + ',\n'.join(self._fragment(room) for room in self._rooms) + '\n]'
+            write_atomic(self.filename, text)
+            self._version = self._file_version()
+
+    def add(self, room_id, remark):
+        """Add a room, or update the remark of an existing one, and save"""
+        with self.lock:
+            self.refresh()
+            room = self.normalize({'room_id': room_id, 'remark': remark})
+            if room['room_id'] in self._by_id:
+                self._rooms = [room if item['room_id'] == room['room_id'] else item for item in self._rooms]
+                self._fragments.pop(room['room_id'], None)
+                self._entries.pop(room['room_id'], None)
+            else:
+                self._rooms = self._rooms + [room]
+            self._index(self._rooms)
+            self.save()
+            return room
+
+    def replace(self, rooms):
+        """Replace every room with the given list and save"""
+        with self.lock:
+            self._index([self.normalize(room) for room in rooms])
+            self._fragments = {}
+            self._entries = {}
+            self.save()
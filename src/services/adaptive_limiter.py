@@ -0,0 +1,68 @@
+import time
+import asyncio
+from collections import deque
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for one danmuji host.
+
+    Until the first congestion signal the limit is in slow start: it grows by
+    one per fast request, doubling every round trip. After that it grows by one
+    for every `limit` requests that complete under the target latency. It is
+    multiplied by `backoff` only when a request fails or runs slower than the
+    target, at most once per observed round trip, so one burst of timeouts
+    counts as a single congestion signal. Only used from the engine loop thread.
+    """
+
+    def __init__(self, initial, minimum, maximum, target_latency, backoff=0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.in_flight = 0
+        self.slow_start = True
+        self.latency = None
+        self._last_decrease = 0.0
+        self._waiters = deque()
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # 已被唤醒但被取消，把名额交给下一个等待者
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self, latency=None, failed=False):
+        """Return a slot and adjust the limit from the request outcome"""
+        self.in_flight -= 1
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+        if failed or (latency is not None and latency > self.target_latency):
+            now = time.monotonic()
+            if now - self._last_decrease >= (self.latency or 0):
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._last_decrease = now
+            self.slow_start = False
+        elif self.slow_start:
+            self.limit = min(self.maximum, self.limit + 1)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
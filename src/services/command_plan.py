@@ -0,0 +1,126 @@
+import time
+import asyncio
+import threading
+
+class PlanStep:
+    """One step of a port's plan: a request, a wait, or running the pending undo requests"""
+
+    REQUEST = 'request'
+    WAIT = 'wait'
+    UNDO = 'undo'
+
+    def __init__(self, kind, request=None, seconds=0, undo=None, state=None, deadline=None):
+        self.kind = kind
+        self.request = request
+        self.seconds = seconds
+        self.undo = undo
+        self.state = state
+        self.deadline = deadline
+
+    @classmethod
+    def send(cls, request, undo=None, state=None):
+        """Send a request (None only registers the undo).
+
+        `undo` is another send step, run by a later UNDO step or when the plan is
+        aborted. `state` holds the fleet state fields the request applies to the port.
+        """
+        return cls(cls.REQUEST, request=request, undo=undo, state=state)
+
+    @classmethod
+    def wait(cls, seconds):
+        return cls(cls.WAIT, seconds=seconds)
+
+    @classmethod
+    def wait_until(cls, deadline):
+        """Wait until a time.monotonic() deadline (no wait if it already passed)"""
+        return cls(cls.WAIT, deadline=deadline)
+
+    @classmethod
+    def revert(cls):
+        return cls(cls.UNDO)
+
+class PlanExecutor:
+    """Run a per-port sequence of steps for every port, each port advancing on its own.
+
+    There is no barrier between stages, so a command takes as long as the slowest
+    single port's chain. A port whose request got no response at all sends the
+    undo requests registered so far and stops its chain early. Undo requests are
+    sent by an UNDO step; on Ctrl-C the undo requests of every unfinished port are
+    sent before the interrupt is re-raised.
+    """
+
+    def __init__(self, http_handler):
+        self.http_handler = http_handler
+        self.lock = threading.Lock()
+        self._undo = {}
+
+    def converged(self, port, step):
+        """Whether the fleet state says the port already has everything the step applies"""
+        return bool(step.state) and all(self.http_handler.fleet_state.get(port, field) == value
+                                        for field, value in step.state.items())
+
+    async def send(self, port, step):
+        fleet_state = self.http_handler.fleet_state
+        unknown = dict.fromkeys(step.state or ())
+        if unknown:
+            # 请求发出后端口状态就不确定了，成功后才记录新状态
+            fleet_state.record(port, **unknown)
+        result = await self.http_handler.send_request_async(**step.request)
+        if unknown:
+            fleet_state.record(port, **(step.state if result.ok else unknown))
+        return result
+
+    async def _send_undo(self, port):
+        pending = self._undo.get(port, [])
+        while pending:
+            # 发送后才移除，被中断时 abort 会补发（sendSet 可以重复发送）
+            if not self.converged(port, pending[-1]):
+                await self.send(port, pending[-1])
+            pending.pop()
+
+    async def run_port(self, port, steps):
+        pending = self._undo[port] = []
+        for step in steps:
+            if step.kind == PlanStep.WAIT:
+                if step.deadline is not None:
+                    await asyncio.sleep(max(0.0, step.deadline - time.monotonic()))
+                else:
+                    await asyncio.sleep(step.seconds)
+            elif step.kind == PlanStep.UNDO:
+                await self._send_undo(port)
+            else:
+                # 先登记恢复请求，这样请求发出后被中断也能恢复
+                if step.undo is not None:
+                    pending.append(step.undo)
+                if step.request is None:
+                    continue
+                result = await self.send(port, step)
+                if result.status is None:
+                    # 超时不代表容器没有执行请求，停止前先把已登记的恢复请求发出去
+                    await self._send_undo(port)
+                    break
+        # 走完的计划不再需要恢复，只有被中断的计划才发送剩余的恢复请求
+        del self._undo[port]
+
+    async def run_async(self, plans):
+        """Run every (port, steps) plan concurrently"""
+        return await self.http_handler.dispatch_tasks(self.run_port(port, steps) for port, steps in plans)
+
+    async def abort_async(self):
+        ports = [port for port, pending in self._undo.items() if pending]
+        await self.http_handler.engine.gather(self._send_undo(port) for port in ports)
+        self._undo = {}
+        return ports
+
+    def run(self, plans):
+        """Run the plans, reverting the ports still mid-plan if interrupted"""
+        try:
+            self.http_handler.run(self.run_async(list(plans)))
+        except KeyboardInterrupt:
+            with self.lock:
+                pending = sum(1 for undo in self._undo.values() if undo)
+                print(f"Interrupt received, reverting {pending} ports mid-plan...")
+            self.http_handler.run(self.abort_async())
+            raise
+        finally:
+            self.http_handler.fleet_state.flush()
@@ -1,15 +1,21 @@
 import os
-import json
 import sys
-import time
 import threading
-import inquirer
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.services.command_plan import PlanStep
+from src.services.config_watcher import create_watcher
+from src.services.fleet_health import PortHealth
+from src.services.fleet_state import body_hash
+from src.services.message_scheduler import MessageScheduler
+from src.services.payload_compiler import PayloadCompiler
 
 class ConfigManager:
+    DEFAULT_CONFIG_FILE = "./config/set-default-idle.json"
+
     def __init__(self, config):
         self.config = config
         self.lock = threading.Lock()
+        self.compiler = PayloadCompiler()
+        self.messages = MessageScheduler(config)
     
     def list_config_files(self, directory='./config'):
         """List all JSON files in the specified directory"""
@@ -24,137 +30,186 @@ class ConfigManager:
                 print("No configuration files found.")
             return None
         
+        # 只有交互式选择才需要 inquirer，延迟导入以加快非交互命令的启动
+        import inquirer
         question = [inquirer.List('config', message="Choose a configuration file", choices=files)]
         answer = inquirer.prompt(question)
         return os.path.join(directory, answer['config'])
     
-    def update_config_from_file(self, config_path):
-        """Load and parse configuration from the specified JSON file"""
-        with self.lock:
-            with open(config_path, 'r') as file:
-                file_config = json.load(file)
-            return json.dumps(file_config)
-    
-    def update_advert_in_config(self, config_path, new_advert_text, is_enabled):
-        """Update advertisement configuration in the JSON file"""
+    def resolve_config_file(self, config_arg):
+        """Resolve -c to a config file path, choosing interactively when no file was given"""
+        # 检查是否传入了配置文件路径
+        if config_arg and config_arg.endswith('.json'):
+            # 如果提供了完整路径，直接使用
+            if os.path.exists(config_arg):
+                return config_arg
+            # 如果只提供了文件名，尝试在 config 目录下查找
+            if os.path.exists(os.path.join('./config', config_arg)):
+                return os.path.join('./config', config_arg)
+            with self.lock:
+                print(f"Error: Config file '{config_arg}' not found.")
+            return None
+
+        # 没有提供文件路径，使用交互式选择
+        config_file = self.choose_config_file()
+        if not config_file:
+            with self.lock:
+                print("No config file selected or available.")
+        return config_file
+
+    def compile_config(self, config_file):
+        """Return the sendSet body of a config file and the fleet state it applies"""
+        body = self.compiler.compile(config_file)
+        return body, {'config_hash': body_hash(body), 'config_file': os.path.abspath(config_file)}
+
+    def config_steps(self, http_handler, port, config, default, wait_time=None, force=False):
+        """Plan steps pushing a config to a port, reverting to the default after wait_time if given.
+
+        `config` and `default` are (body, state) pairs from compile_config. A port
+        already running the config is not pushed again.
+        """
+        body, state = config
+        default_body, default_state = default
+        converged = not force and all(http_handler.fleet_state.get(port, field) == value
+                                      for field, value in state.items())
+        timed = wait_time and wait_time > 0
+        if converged and not timed:
+            return []
+        # 被中断时恢复默认配置
+        undo = PlanStep.send(http_handler.send_set_request(port, default_body), state=default_state)
+        steps = [PlanStep.send(None if converged else http_handler.send_set_request(port, body),
+                               undo=undo, state=state)]
+        if timed:
+            steps += [PlanStep.wait(wait_time), PlanStep.revert()]
+        return steps
+
+    def process_config_command(self, http_handler, ports, args, rooms=None):
+        """Push the -c config as one per-port plan, connecting each port to rooms[port] first if given.
+
+        Only the sendSet/connectRoom calls a port still needs are sent (unless --force).
+        """
+        if args.config == -1:
+            return False
+
+        config_file = self.resolve_config_file(args.config)
+        if not config_file:
+            return False
+
         with self.lock:
-            with open(config_path, 'r') as file:
-                config_data = json.load(file)
-            
-            if 'advert' in config_data:
-                if 'adverts' in config_data['advert']:
-                    config_data['advert']['adverts'] = new_advert_text
-                config_data['advert']['is_open'] = is_enabled
-            
-            return json.dumps(config_data, indent=4)
-    
-    def process_config_command(self, http_handler, ports, args):
-        """Process configuration command with error handling"""
+            print(f"Loading configuration from: {config_file}")
+            if args.time and args.time > 0:
+                print(f"Waiting for {args.time} seconds before loading default configuration...")
+
+        force = getattr(args, 'force', False)
+        config = self.compile_config(config_file)
+        default = self.compile_config(self.DEFAULT_CONFIG_FILE)
+        plans = []
+        for port in ports:
+            steps = http_handler.connect_steps(port, rooms[port], force) if rooms else []
+            plans.append((port, steps + self.config_steps(http_handler, port, config, default, args.time, force)))
+
         try:
-            if args.config != -1:
-                # 处理配置文件
-                config_file = None
-                
-                # 检查是否传入了配置文件路径
-                if args.config and args.config.endswith('.json'):
-                    # 如果提供了完整路径，直接使用
-                    if os.path.exists(args.config):
-                        config_file = args.config
-                    # 如果只提供了文件名，尝试在 config 目录下查找
-                    elif os.path.exists(os.path.join('./config', args.config)):
-                        config_file = os.path.join('./config', args.config)
-                    else:
-                        with self.lock:
-                            print(f"Error: Config file '{args.config}' not found.")
-                        return False
-                else:
-                    # 没有提供文件路径，使用交互式选择
-                    config_file = self.choose_config_file()
-                
-                # 如果找到配置文件，则应用它
-                if config_file:
-                    with self.lock:
-                        print(f"Loading configuration from: {config_file}")
-                    
-                    config_data = self.update_config_from_file(config_file)
-                    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
-                        futures = []
-                        for port in ports:
-                            url = f"http://{self.config['ip_address']}:{port}/sendSet"
-                            data = {'set': config_data}
-                            futures.append(executor.submit(http_handler.send_request, url, 'post', data))
-                        
-                        for future in as_completed(futures):
-                            future.result()
-                else:
-                    with self.lock:
-                        print("No config file selected or available.")
-                    return False
-                
-                # 处理等待时间 - 现在使用单独的 -t/--time 参数
-                if args.time and args.time > 0:
-                    wait_time = args.time
-                    with self.lock:
-                        print(f"Waiting for {wait_time} seconds before loading default configuration...")
-                    
-                    time.sleep(wait_time)
-                    default_config_file = "./config/set-default-idle.json"
-                    
-                    with self.lock:
-                        print(f"Loading default configuration from: {default_config_file}")
-                        
-                    config_data = self.update_config_from_file(default_config_file)
-                    
-                    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
-                        futures = []
-                        for port in ports:
-                            url = f"http://{self.config['ip_address']}:{port}/sendSet"
-                            data = {'set': config_data}
-                            futures.append(executor.submit(http_handler.send_request, url, 'post', data))
-                        
-                        for future in as_completed(futures):
-                            future.result()
-                
-                return True
-            return False
-        
+            http_handler.run_plans(plans)
         except KeyboardInterrupt:
-            with self.lock:
-                print("Interrupt received, updating default configuration...")
-            
-            config_file = "./config/set-default-idle.json"
-            config_data = self.update_config_from_file(config_file)
-            
-            with ThreadPoolExecutor(max_workers=len(ports)) as executor:
-                futures = []
-                for port in ports:
-                    url = f"http://{self.config['ip_address']}:{port}/sendSet"
-                    data = {'set': config_data}
-                    futures.append(executor.submit(http_handler.send_request, url, 'post', data))
-                
-                for future in as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception:
-                        pass
-            
             with self.lock:
                 print("Default configuration updated on interrupt.")
             sys.exit(0)
-    
+        return True
+
+    def push_changed_config(self, http_handler, ports, config_file):
+        """Push an edited config file only to the ports currently running it"""
+        running = http_handler.fleet_state.ports_running(config_file, ports)
+        if not running:
+            with self.lock:
+                print(f"{config_file} changed, no port is running it.")
+            return
+        config = self.compile_config(config_file)
+        default = self.compile_config(self.DEFAULT_CONFIG_FILE)
+        with self.lock:
+            print(f"{config_file} changed, pushing it to the {len(running)} ports running it.")
+        http_handler.run_plans((port, self.config_steps(http_handler, port, config, default)) for port in running)
+
+    def watch(self, http_handler, ports, room_file=None, resolve_rooms=None, directory='./config'):
+        """Watch the config directory (and room_file) and hot-push edits until Ctrl-C.
+
+        Bursts of edits are debounced. An edited config goes only to the ports
+        running it. When room_file changes, resolve_rooms() is called again and
+        ports whose room changed are reconnected. A file that cannot be read or
+        parsed is reported and skipped until its next edit.
+        """
+        watcher = create_watcher(directory, [room_file] if room_file else [],
+                                 self.config.get('watch_poll_interval', 1.0))
+        debounce = self.config.get('watch_debounce', 0.5)
+        room_path = os.path.abspath(room_file) if room_file else None
+        with self.lock:
+            print(f"Watching {directory}{' and ' + room_file if room_file else ''} "
+                  f"({type(watcher).__name__}), press Ctrl-C to stop.")
+        try:
+            while True:
+                changed = watcher.wait()
+                # 编辑器保存时常常连续写多次，安静 debounce 秒后再推送
+                while True:
+                    more = watcher.wait(debounce)
+                    if not more:
+                        break
+                    changed |= more
+
+                for path in sorted(changed):
+                    try:
+                        if path == room_path:
+                            rooms = resolve_rooms() if resolve_rooms else None
+                            if rooms:
+                                http_handler.run_plans((port, http_handler.connect_steps(port, room_id))
+                                                       for port, room_id in rooms.items())
+                        elif os.path.exists(path):
+                            self.push_changed_config(http_handler, ports, os.path.relpath(path))
+                    except (ValueError, OSError) as exc:
+                        # 保存到一半或写错的文件跳过，等下一次修改
+                        with self.lock:
+                            print(f"Error: could not apply {os.path.relpath(path)}, skipping it: {exc}")
+        except KeyboardInterrupt:
+            with self.lock:
+                print("Stopped watching.")
+        finally:
+            watcher.close()
+
     def process_message_command(self, http_handler, ports, message):
-        """Process message command with multithreading"""
+        """Schedule -m messages onto the fleet and send each port's advert cycles in order"""
         config_file_path = "./config/set-custom-ad-template.json"
-        config_data_true_list = []
-        config_data_false = self.update_advert_in_config(config_file_path, "", False)
-        
+        body_false = self.compiler.compile_advert(config_file_path, "", False)
+        revert_delay = self.config.get('message_revert_delay', 5)
+        # 一轮带多条消息时，danmuji 每隔 advert.time 秒才发下一条
+        advert_interval = self.compiler.load(config_file_path).get('advert', {}).get('time', 0)
+
         if '+' in message:
-            processed_messages = message.split('+')
-            for msg in processed_messages:
-                config_data_true_list.append(self.update_advert_in_config(config_file_path, msg, True))
+            # 熔断中的端口不参与分配，消息交给其他端口
+            available = [port for port in ports if http_handler.health.snapshot(str(port))['state'] != PortHealth.OPEN]
+            cycles, completion = self.messages.plan(available or ports, message.split('+'), revert_delay, advert_interval)
         else:
-            for _ in ports:
-                config_data_true_list.append(self.update_advert_in_config(config_file_path, message, True))
-        
-        http_handler.process_parallel_config_requests(ports, config_data_true_list, config_data_false)
-        return True 
\ No newline at end of file
+            # The same message is sent from every port
+            cycles, completion = self.messages.broadcast(ports, message, revert_delay, advert_interval)
+        if not cycles:
+            return False
+
+        # 同一轮分到同一端口的多条消息合并成一个广告列表
+        bodies = {}
+        schedule = []
+        for cycle in cycles:
+            text = "\n".join(cycle.messages)
+            if text not in bodies:
+                bodies[text] = self.compiler.compile_advert(config_file_path, text, True)
+            schedule.append((cycle.port, cycle.start, bodies[text], cycle.length))
+
+        with self.lock:
+            busy_ports = len({cycle.port for cycle in cycles})
+            message_count = sum(len(cycle.messages) for cycle in cycles)
+            print(f"Scheduled {message_count} messages on {busy_ports} ports in {len(cycles)} advert cycles, "
+                  f"projected completion in {completion:.1f} s")
+
+        # 广告轮次会改动端口的配置，之后的 -c 需要重新推送
+        for port in {cycle.port for cycle in cycles}:
+            http_handler.fleet_state.record(port, config_hash=None, config_file=None)
+        http_handler.fleet_state.flush()
+
+        http_handler.process_message_cycles(schedule, body_false)
+        return True
@@ -0,0 +1,106 @@
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+class PollingWatcher:
+    """Detect changed files by comparing (mtime, size) snapshots of the watched files"""
+
+    def __init__(self, directory, files=(), interval=1.0):
+        self.directory = os.path.abspath(directory)
+        self.files = [os.path.abspath(path) for path in files]
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json') and entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        for path in self.files:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout=None):
+        """Return the set of paths that changed, waiting up to timeout seconds (forever if None)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.scan()
+            changed = {path for path in snapshot.keys() | self.snapshot.keys()
+                       if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            delay = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            time.sleep(max(delay, 0))
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """Linux inotify watcher through ctypes, watching whole directories so atomic saves are seen"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, directory, files=()):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directory = os.path.abspath(directory)
+        self.files = {os.path.abspath(path) for path in files}
+        self.watches = {}
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_DELETE
+        for path in {self.directory} | {os.path.dirname(path) for path in self.files}:
+            wd = libc.inotify_add_watch(self.fd, path.encode(), mask)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+            self.watches[wd] = path
+
+    def wanted(self, path):
+        return path in self.files or (os.path.dirname(path) == self.directory and path.endswith('.json'))
+
+    def wait(self, timeout=None):
+        """Return the set of paths that changed, waiting up to timeout seconds (forever if None)"""
+        changed = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            path = os.path.join(self.watches.get(wd, ''), name)
+            if self.wanted(path):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def create_watcher(directory, files=(), interval=1.0):
+    """Use inotify where available, otherwise fall back to polling"""
+    try:
+        return InotifyWatcher(directory, files)
+    except (OSError, AttributeError):
+        return PollingWatcher(directory, files, interval)
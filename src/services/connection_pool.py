@@ -0,0 +1,169 @@
+import asyncio
+from urllib.parse import urlsplit, urlencode
+
+class RequestError(Exception):
+    """A request that got no complete HTTP response: refused, reset, malformed or timed out"""
+
+class ConnectTimeout(RequestError):
+    pass
+
+class ConnectFailed(RequestError):
+    pass
+
+class ReadTimeout(RequestError):
+    pass
+
+class ConnectionAborted(RequestError):
+    pass
+
+class Response:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        charset = 'utf-8'
+        for param in self.headers.get('content-type', '').split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'charset' and value:
+                charset = value.strip('"')
+        try:
+            return self.content.decode(charset, errors='replace')
+        except LookupError:
+            return self.content.decode('utf-8', errors='replace')
+
+class ConnectionPool:
+    """Non-blocking keep-alive HTTP/1.1 connections shared by every fan-out path, keyed by ip_address:port.
+
+    Requests run on the engine loop itself, so an in-flight request costs a socket
+    and a coroutine instead of a worker thread. Up to `pool_size` idle connections
+    are kept per port. Only use it from the engine loop.
+    """
+
+    def __init__(self, config):
+        self.pool_size = config.get('pool_size', 4)
+        self.timeout = (config.get('connect_timeout', 3), config.get('read_timeout', 10))
+        self.idle = {}
+
+    @staticmethod
+    def encode(data):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = urlencode(data)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return data
+
+    async def request(self, method, url, data=None, headers=None, timeout=None):
+        """Send a request over a pooled connection for the URL's ip_address:port and return its Response.
+
+        Raises RequestError when no complete response arrives.
+        """
+        parts = urlsplit(url)
+        netloc = parts.netloc
+        body = self.encode(data)
+        lines = [f"{method} {parts.path or '/'}{'?' + parts.query if parts.query else ''} HTTP/1.1",
+                 f"Host: {netloc}", "Accept: */*", f"Content-Length: {len(body)}"]
+        lines.extend(f"{key}: {value}" for key, value in (headers or {}).items())
+        message = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+        connect_timeout, read_timeout = (timeout, timeout) if timeout else self.timeout
+
+        idle = self.idle.get(netloc, [])
+        while idle:
+            connection = idle.pop()
+            if connection[0].at_eof():
+                connection[1].close()
+                continue
+            response = await self.exchange(netloc, connection, message, method, read_timeout, reused=True)
+            if response is not None:
+                return response
+        return await self.exchange(netloc, await self.open(netloc, connect_timeout), message, method, read_timeout)
+
+    async def open(self, netloc, timeout):
+        host, _, port = netloc.rpartition(':')
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+        except asyncio.TimeoutError:
+            raise ConnectTimeout(f"{netloc}: Connect timed out. (connect timeout={timeout})") from None
+        except OSError as e:
+            raise ConnectFailed(f"{netloc}: Failed to establish a new connection: {e.strerror or e}") from None
+
+    async def exchange(self, netloc, connection, message, method, timeout, reused=False):
+        """Write one request and read its response, keeping the connection if it can be reused.
+
+        Returns None when a reused connection turns out to have been closed by the
+        container before answering, so the caller can retry on a fresh one.
+        """
+        reader, writer = connection
+        received = []
+
+        async def roundtrip():
+            writer.write(message)
+            await writer.drain()
+            return await self.read_response(reader, method, received)
+
+        try:
+            response, keep = await asyncio.wait_for(roundtrip(), timeout)
+        except asyncio.TimeoutError:
+            writer.close()
+            raise ReadTimeout(f"{netloc}: Read timed out. (read timeout={timeout})") from None
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            writer.close()
+            # 空闲连接可能已被容器关闭：一个字节都没收到时换新连接重发
+            if reused and not received and isinstance(e, (ConnectionError, asyncio.IncompleteReadError)):
+                return None
+            raise ConnectionAborted(f"{netloc}: Connection aborted: {e!r}") from None
+        except BaseException:
+            writer.close()
+            raise
+        if keep and len(self.idle.setdefault(netloc, [])) < self.pool_size:
+            self.idle[netloc].append(connection)
+        else:
+            writer.close()
+        return response
+
+    @staticmethod
+    async def read_response(reader, method, received):
+        """Read one response, returning (Response, whether the connection can be reused)"""
+        status_line = await reader.readuntil(b'\r\n')
+        received.append(status_line)
+        version, status = status_line.decode('latin-1').split(None, 2)[:2]
+        status = int(status)
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        keep = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304) or status < 200:
+            content = b''
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if not size:
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            content = b''.join(chunks)
+        elif 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        else:
+            content = await reader.read()
+            keep = False
+        return Response(status, headers, content), keep
+
+    async def close(self):
+        """Close every pooled connection"""
+        idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
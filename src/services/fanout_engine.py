@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+class FanoutEngine:
+    """Shared asyncio dispatch engine with a bounded number of in-flight calls.
+
+    Everything runs on one loop thread with non-blocking I/O, so the number of
+    calls in flight does not cost threads. Calls can be sharded (one shard per
+    danmuji host): each shard has its own in-flight limit, so a slow host cannot
+    starve the others.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.max_in_flight = config.get('max_in_flight', 64)
+        self.lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._shards = {}
+
+    def start(self):
+        """Start the engine loop thread on first use and return the loop"""
+        with self.lock:
+            if self._loop is not None:
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run_loop, name='fanout-loop', daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            return loop
+
+    def _get_shard(self, shard):
+        """Return the in-flight semaphore of a shard, creating it on first use"""
+        semaphore = self._shards.get(shard)
+        if semaphore is None:
+            semaphore = self._shards[shard] = asyncio.Semaphore(self.max_in_flight)
+        return semaphore
+
+    async def call(self, coro, delay=0, shard=None):
+        """Await a non-blocking call once one of the shard's in-flight slots is free"""
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            async with self._get_shard(shard):
+                return await coro
+        finally:
+            # 取消时 coro 可能还没开始运行
+            coro.close()
+
+    async def gather(self, coros):
+        """Await all coroutines concurrently, returning exceptions in place of results"""
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+    def run(self, coro):
+        """Run a coroutine on the engine loop and block until it completes"""
+        loop = self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            raise
+
+    def run_all(self, coros):
+        """Synchronous wrapper around gather for CLI call sites"""
+        return self.run(self.gather(list(coros)))
+
+    def close(self):
+        """Stop the engine loop"""
+        with self.lock:
+            loop, self._loop = self._loop, None
+            if loop is None:
+                return
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join()
+            loop.close()
+            self._shards = {}
@@ -0,0 +1,93 @@
+import math
+import time
+import threading
+from collections import deque
+
+class PortHealth:
+    """Latency and failure state for one danmuji endpoint"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.ewma = None
+        self.last_latency = None
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.last_error = None
+
+    @property
+    def p99(self):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[math.ceil(0.99 * len(ordered)) - 1]
+
+class FleetHealth:
+    """Per-endpoint latency tracking (EWMA and p99) with a circuit breaker.
+
+    After `breaker_failures` consecutive failures an endpoint's circuit opens and
+    requests to it fail fast. Once `breaker_reset` seconds have passed a single
+    trial request is let through (half-open); its outcome closes or re-opens it.
+    """
+
+    def __init__(self, config):
+        self.failure_threshold = config.get('breaker_failures', 3)
+        self.reset_timeout = config.get('breaker_reset', 30)
+        self.alpha = config.get('latency_ewma_alpha', 0.2)
+        self.window = config.get('latency_window', 100)
+        self.lock = threading.Lock()
+        self.ports = {}
+
+    def _get(self, key):
+        health = self.ports.get(key)
+        if health is None:
+            health = self.ports[key] = PortHealth(self.window)
+        return health
+
+    def allow(self, key):
+        """Return True if a request to the endpoint may be sent now"""
+        with self.lock:
+            health = self._get(key)
+            if health.state == PortHealth.CLOSED:
+                return True
+            if health.state == PortHealth.OPEN and time.monotonic() - health.opened_at >= self.reset_timeout:
+                # 放行一个试探请求
+                health.state = PortHealth.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self, key, latency):
+        with self.lock:
+            health = self._get(key)
+            health.samples.append(latency)
+            health.last_latency = latency
+            health.ewma = latency if health.ewma is None else self.alpha * latency + (1 - self.alpha) * health.ewma
+            health.consecutive_failures = 0
+            health.state = PortHealth.CLOSED
+            health.last_error = None
+
+    def record_failure(self, key, error):
+        with self.lock:
+            health = self._get(key)
+            health.consecutive_failures += 1
+            health.last_error = type(error).__name__ if isinstance(error, Exception) else str(error)
+            if health.state == PortHealth.HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+                health.state = PortHealth.OPEN
+                health.opened_at = time.monotonic()
+
+    def snapshot(self, key):
+        """Return a copy of the endpoint state for reporting"""
+        with self.lock:
+            health = self._get(key)
+            return {
+                'state': health.state,
+                'last_ms': None if health.last_latency is None else health.last_latency * 1000,
+                'ewma_ms': None if health.ewma is None else health.ewma * 1000,
+                'p99_ms': None if health.p99 is None else health.p99 * 1000,
+                'failures': health.consecutive_failures,
+                'error': health.last_error,
+            }
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from src.utils.atomic_file import write_atomic
+
+def body_hash(body):
+    return hashlib.sha256(body).hexdigest()
+
+class FleetState:
+    """Persisted last-applied config and room per port.
+
+    Every port entry holds config_hash/config_file (the last sendSet that
+    succeeded) and room_id (the last successful connectRoom). A failed or
+    unknown outcome stores None, so the next command pushes again. Every host
+    entry holds the concurrency limit learned for it, so the next command does
+    not slow-start from scratch. Entries older than `ttl` seconds are treated as
+    unknown, because containers can be restarted behind our back.
+    """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.ports = None
+        self.hosts = None
+        self.dirty = False
+
+    def load(self):
+        if self.ports is not None:
+            return
+        data = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        self.ports = data.get('ports', {})
+        self.hosts = data.get('hosts', {})
+
+    def get(self, port, field):
+        """Return the recorded value for a port, or None if unknown or expired"""
+        with self.lock:
+            self.load()
+            state = self.ports.get(str(port))
+            if state is None or field not in state:
+                return None
+            if self.ttl and time.time() - state.get('updated', 0) > self.ttl:
+                return None
+            return state[field]
+
+    def ports_running(self, config_file, ports):
+        """The given ports whose last applied config came from config_file"""
+        path = os.path.abspath(config_file)
+        return [port for port in ports if self.get(port, 'config_file') == path]
+
+    def record(self, port, **fields):
+        with self.lock:
+            self.load()
+            state = self.ports.setdefault(str(port), {})
+            state.update(fields)
+            state['updated'] = round(time.time(), 3)
+            self.dirty = True
+
+    def host_limit(self, host):
+        """Return the concurrency limit learned for a host, or None if unknown or expired"""
+        with self.lock:
+            self.load()
+            state = self.hosts.get(str(host))
+            if state is None or (self.ttl and time.time() - state.get('updated', 0) > self.ttl):
+                return None
+            return state['limit']
+
+    def record_host_limit(self, host, limit):
+        with self.lock:
+            self.load()
+            self.hosts[str(host)] = {'limit': limit, 'updated': round(time.time(), 3)}
+            self.dirty = True
+
+    def forget(self, ports):
+        """Drop what is known about the ports, e.g. after their danmuji quit"""
+        with self.lock:
+            self.load()
+            for port in ports:
+                if self.ports.pop(str(port), None) is not None:
+                    self.dirty = True
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty or not self.path:
+                return
+            write_atomic(self.path, json.dumps({'ports': self.ports, 'hosts': self.hosts}, indent=4, ensure_ascii=False))
+            self.dirty = False
@@ -1,124 +1,363 @@
+import sys
+import json
 import time
+import queue
+import random
+import asyncio
 import threading
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextlib
+import contextvars
+from urllib.parse import urlsplit
+from src.config.topology import Endpoint
+from src.services.adaptive_limiter import AdaptiveLimiter
+from src.services.command_plan import PlanExecutor, PlanStep
+from src.services.connection_pool import ConnectionPool, RequestError
+from src.services.fanout_engine import FanoutEngine
+from src.services.fleet_health import FleetHealth
+from src.services.fleet_state import FleetState
+from src.services.login_state import LoginState, iter_cookie_vault
+from src.services.metrics import FleetMetrics, RequestResult
+
+class CommandScope:
+    """Result queue and output settings of one command"""
+
+    def __init__(self, verbose=False, jsonl_path=None):
+        self.verbose = verbose
+        self.jsonl_path = jsonl_path
+        # Workers only enqueue results; they are printed and aggregated once per command
+        self.results = queue.SimpleQueue()
 
 class HttpRequestHandler:
-    def __init__(self, config):
+    SUPPORTED_METHODS = ('get', 'post', 'put', 'delete')
+    FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+    IDEMPOTENT_ENDPOINTS = ('disconnectRoom', 'connectRoom', 'sendSet')
+
+    def __init__(self, config, engine=None, pool=None):
         self.config = config
         self.lock = threading.Lock()
-    
-    def send_request(self, url, method='get', data=None, headers=None, delay=0):
-        """Send an HTTP request with specified parameters"""
-        if delay:
-            time.sleep(delay)
+        self.engine = engine or FanoutEngine(config)
+        self.pool = pool or ConnectionPool(config)
+        self.health = FleetHealth(config)
+        self.limiters = {}
+        self.metrics = FleetMetrics()
+        self.login_state = LoginState(config.get('login_state_file'), config.get('login_state_ttl'))
+        self.fleet_state = FleetState(config.get('fleet_state_file'), config.get('fleet_state_ttl'))
+        # 每条命令（以及它在引擎循环上的任务）有自己的 CommandScope，守护进程中的命令可以同时运行
+        self._scope = contextvars.ContextVar('command_scope', default=CommandScope())
+
+    @property
+    def scope(self):
+        return self._scope.get()
+
+    @contextlib.contextmanager
+    def command(self, verbose=False, jsonl_path=None):
+        """Give the calling command its own result queue and output settings"""
+        token = self._scope.set(CommandScope(verbose, jsonl_path))
+        try:
+            yield self.scope
+        finally:
+            self._scope.reset(token)
+
+    def build_url(self, port, endpoint, param=None):
+        """Build the danmuji URL for an endpoint on a port or (host, port) Endpoint"""
+        if isinstance(port, Endpoint):
+            url = f"http://{port.host}:{port.port}/{endpoint}"
+        else:
+            url = f"http://{self.config['ip_address']}:{port}/{endpoint}"
+        if param:
+            url += f"?{param}"
+        return url
+
+    async def perform_request(self, url, method='get', data=None, headers=None):
+        """Send one HTTP request and return its RequestResult without printing"""
+        result = RequestResult(url, method, data)
+        if method.lower() not in self.SUPPORTED_METHODS:
+            result.outcome, result.error = RequestResult.INVALID, "Unsupported HTTP method."
+            return result
+
+        if not self.health.allow(result.port):
+            result.outcome, result.error = RequestResult.SKIPPED, "circuit open after repeated failures"
+            return result
+
+        started = time.perf_counter()
+        try:
+            response = await self.pool.request(method.upper(), url, data=data, headers=headers)
+        except RequestError as e:
+            result.elapsed = time.perf_counter() - started
+            self.health.record_failure(result.port, e)
+            result.outcome, result.error, result.retryable = RequestResult.CONNECTION_ERROR, str(e), True
+            return result
+        result.elapsed = time.perf_counter() - started
+        self.health.record_success(result.port, result.elapsed)
+
+        result.status = response.status_code
+        result.body = response.text
+        result.bytes_received = len(response.content)
+        # 5xx 和 429 说明容器过载，可以重试
+        result.retryable = response.status_code >= 500 or response.status_code == 429
+        result.outcome = RequestResult.HTTP_ERROR if result.retryable else RequestResult.OK
+        return result
+
+    async def probe(self, port):
+        """Probe one port, bypassing the circuit breaker, and return its health snapshot"""
+        url = self.build_url(port, self.config.get('health_endpoint', ''))
+        endpoint_key = urlsplit(url).netloc
+        started = time.perf_counter()
         try:
-            if method.lower() == 'get':
-                response = requests.get(url, headers=headers)
-            elif method.lower() == 'post':
-                response = requests.post(url, data=data, headers=headers)
-            elif method.lower() == 'put':
-                response = requests.put(url, data=data, headers=headers)
-            elif method.lower() == 'delete':
-                response = requests.delete(url, headers=headers)
-            else:
+            await self.pool.request('GET', url, timeout=self.config.get('probe_timeout', 1))
+        except RequestError as e:
+            self.health.record_failure(endpoint_key, e)
+        else:
+            # 任何 HTTP 响应都说明容器在线
+            self.health.record_success(endpoint_key, time.perf_counter() - started)
+        return self.health.snapshot(endpoint_key)
+
+    def check_health(self, ports):
+        """Probe every port concurrently and print one fleet health report"""
+        snapshots = self.engine.run_all(self.engine.call(self.probe(port), shard=getattr(port, 'host', None))
+                                        for port in ports)
+
+        def fmt(value):
+            return '-' if value is None else f"{value:.1f}"
+
+        healthy = 0
+        with self.lock:
+            print(f"{'ENDPOINT':<22}{'STATE':<11}{'LAST ms':>9}{'EWMA ms':>9}{'P99 ms':>9}{'FAILS':>7}  ERROR")
+            for port, snapshot in zip(ports, snapshots):
+                if isinstance(snapshot, Exception):
+                    print(f"{port:<22}{'error':<11}{'-':>9}{'-':>9}{'-':>9}{'-':>7}  {snapshot}")
+                    continue
+                if not snapshot['failures']:
+                    healthy += 1
+                print(f"{port:<22}{snapshot['state']:<11}{fmt(snapshot['last_ms']):>9}{fmt(snapshot['ewma_ms']):>9}"
+                      f"{fmt(snapshot['p99_ms']):>9}{snapshot['failures']:>7}  {snapshot['error'] or ''}")
+            print(f"{healthy}/{len(ports)} ports healthy.")
+        return snapshots
+
+    def get_limiter(self, host):
+        """Return the adaptive concurrency limiter for a host (engine loop only)"""
+        limiter = self.limiters.get(host)
+        if limiter is None:
+            # 第一次连接主机时从较小的并发开始慢启动，之后沿用上次学到的并发
+            limiter = self.limiters[host] = AdaptiveLimiter(
+                initial=self.fleet_state.host_limit(host) or self.config.get('host_initial_concurrency', 32),
+                minimum=self.config.get('host_min_concurrency', 2),
+                maximum=self.config.get('host_max_concurrency', self.engine.max_in_flight),
+                target_latency=self.config.get('target_latency', 1.0),
+            )
+        return limiter
+
+    def retry_delay(self, attempt):
+        """Full-jitter exponential backoff before retry number `attempt`"""
+        ceiling = min(self.config.get('retry_backoff_max', 2.0), self.config.get('retry_backoff', 0.2) * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    async def send_request_async(self, url, method='get', data=None, headers=None, delay=0):
+        """Send a request under the host's adaptive limit, retrying idempotent endpoints"""
+        if delay:
+            await asyncio.sleep(delay)
+
+        parts = urlsplit(url)
+        limiter = self.get_limiter(parts.hostname)
+        retries = self.config.get('max_retries', 2) if parts.path.strip('/') in self.IDEMPOTENT_ENDPOINTS else 0
+
+        started = time.perf_counter()
+        for attempt in range(retries + 1):
+            await limiter.acquire()
+            attempt_started = time.perf_counter()
+            result = None
+            try:
+                result = await self.engine.call(self.perform_request(url, method, data, headers),
+                                                shard=parts.hostname)
+            finally:
+                limiter.release(time.perf_counter() - attempt_started,
+                                failed=result is None or (not result.ok and result.retryable))
+            if result.ok or not result.retryable or attempt == retries:
+                break
+            await asyncio.sleep(self.retry_delay(attempt))
+
+        result.attempts = attempt + 1
+        if attempt:
+            result.elapsed = time.perf_counter() - started
+        self.scope.results.put(result)
+        return result
+
+    async def dispatch_async(self, request_list):
+        """Send a batch of requests concurrently and wait for all of them"""
+        return await self.dispatch_tasks(self.send_request_async(**request) for request in request_list)
+
+    async def dispatch_tasks(self, coros):
+        """Await coroutines concurrently, printing any exception they raised"""
+        results = await self.engine.gather(coros)
+        for result in results:
+            if isinstance(result, Exception):
                 with self.lock:
-                    print("Unsupported HTTP method.")
-                return
-            
-            result = f"URL: {url}, Status Code: {response.status_code}, Response: {response.text}"
+                    print(f"Request generated an exception: {result}")
+        return results
+
+    def report_results(self):
+        """Drain the command's queued results, fold them into metrics and print one summary per endpoint"""
+        scope = self.scope
+        results = []
+        while True:
+            try:
+                results.append(scope.results.get_nowait())
+            except queue.Empty:
+                break
+        if not results:
+            return results
+
+        self.metrics.record(results)
+        if scope.jsonl_path:
+            with open(scope.jsonl_path, 'a', encoding='utf-8') as file:
+                file.writelines(json.dumps(result.to_dict(), ensure_ascii=False) + '\n' for result in results)
+
+        by_endpoint = {}
+        for result in results:
+            by_endpoint.setdefault(result.endpoint, []).append(result)
+
+        lines = []
+        for endpoint, group in by_endpoint.items():
+            ok = sum(1 for result in group if result.ok)
+            latencies = sorted(result.elapsed for result in group if result.status is not None)
+            summary = f"{endpoint or '/'}: {ok}/{len(group)} ok"
+            if latencies:
+                summary += (f", p50 {latencies[len(latencies) // 2] * 1000:.1f} ms"
+                            f", max {latencies[-1] * 1000:.1f} ms")
+            retried = sum(1 for result in group if result.attempts > 1)
+            if retried:
+                summary += f", {retried} retried"
+            lines.extend(result.message for result in group if scope.verbose or not result.ok)
+            lines.append(summary)
+        sys.stdout.write('\n'.join(lines) + '\n')
+        return results
+
+    def dump_metrics(self, path):
+        """Write the metrics in Prometheus text format to a file, or stdout for '-'"""
+        text = self.metrics.prometheus()
+        if path == '-':
+            sys.stdout.write(text)
+            return
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+    def run(self, coro):
+        """Run a coroutine on the engine, then report the results it produced"""
+        try:
+            return self.engine.run(coro)
+        finally:
+            self.save_limits()
+            self.report_results()
+
+    def save_limits(self):
+        """Remember each host's limit for the next command, never below the configured starting limit"""
+        initial = self.config.get('host_initial_concurrency', 32)
+        for host, limiter in list(self.limiters.items()):
+            self.fleet_state.record_host_limit(host, max(initial, int(limiter.limit)))
+        self.fleet_state.flush()
+
+    def close(self):
+        """Close the pooled connections on the engine loop, then stop the loop"""
+        if self.pool.idle:
+            self.engine.run(self.pool.close())
+        self.engine.close()
+
+    def dispatch(self, request_list):
+        """Synchronous wrapper around dispatch_async"""
+        return self.run(self.dispatch_async(request_list))
+
+    def process_requests(self, ports, endpoint, param=None):
+        """Process requests to multiple ports concurrently"""
+        return self.dispatch([{'url': self.build_url(port, endpoint, param)} for port in ports])
+
+    def connect_steps(self, port, room_id, force=False):
+        """Plan steps moving a port to a room: disconnect, then connect (none if already there)"""
+        if not force and self.fleet_state.get(port, 'room_id') == room_id:
+            return []
+        return [PlanStep.send({'url': self.build_url(port, 'disconnectRoom')}, state={'room_id': None}),
+                PlanStep.send({'url': self.build_url(port, 'connectRoom', f"roomid={room_id}")},
+                              state={'room_id': room_id})]
+
+    def disconnect_steps(self, port):
+        return [PlanStep.send({'url': self.build_url(port, 'disconnectRoom')}, state={'room_id': None})]
+
+    def run_plans(self, plans):
+        """Run (port, steps) plans, each port advancing through its own steps.
+
+        Ports with no steps are already in the desired state and are only counted.
+        """
+        plans = list(plans)
+        pending = [(port, steps) for port, steps in plans if steps]
+        if len(pending) < len(plans):
             with self.lock:
-                print(result)
-            return result
-        except requests.RequestException as e:
-            error_msg = f"Error connecting to {url}: {e}"
+                print(f"{len(plans) - len(pending)}/{len(plans)} ports already in the desired state, "
+                      f"updating {len(pending)}.")
+        if pending:
+            PlanExecutor(self).run(pending)
+
+    def send_set_request(self, port, body):
+        """Build a sendSet request carrying a pre-encoded body"""
+        return {'url': self.build_url(port, 'sendSet'), 'method': 'post', 'data': body,
+                'headers': self.FORM_HEADERS}
+
+    async def push_config_async(self, ports, body):
+        """Push the same pre-encoded sendSet body to every port"""
+        return await self.dispatch_async([self.send_set_request(port, body) for port in ports])
+
+    def push_config(self, ports, body):
+        """Synchronous wrapper around push_config_async"""
+        return self.run(self.push_config_async(ports, body))
+
+    def send_cookie_requests(self, filename, ports, force=False):
+        """Push cookies to the ports whose account changed or whose last login failed"""
+        pushes, up_to_date, unassigned, elsewhere = self.login_state.plan(iter_cookie_vault(filename), ports, force)
+
+        request_list = []
+        for port, account, cookie, _ in pushes:
+            request_list.append({
+                'url': self.build_url(port, 'customCookie'),
+                'method': 'post',
+                'data': {'cookie': cookie},
+                'headers': self.FORM_HEADERS,
+            })
             with self.lock:
-                print(error_msg)
-            return error_msg
-    
-    def process_requests(self, ports, endpoint, param=None):
-        """Process requests to multiple ports with multithreading"""
-        urls = [f"http://{self.config['ip_address']}:{port}/{endpoint}" for port in ports]
-        if param:
-            urls = [url + f"?{param}" for url in urls]
-        
-        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
-            futures = [executor.submit(self.send_request, url) for url in urls]
-            for future in as_completed(futures):
-                future.result()  # Results already printed in send_request
-        
+                print(f"Sending data for {account} to port {port}")
+
+        try:
+            results = self.dispatch(request_list) if request_list else []
+            for (port, account, _, digest), result in zip(pushes, results):
+                self.login_state.record(port, account, digest, isinstance(result, RequestResult) and result.ok)
+        finally:
+            self.login_state.flush()
+
+        summary = f"Login: {len(pushes)} pushed, {up_to_date} already logged in"
+        if elsewhere:
+            summary += f", {len(elsewhere)} assigned to ports outside this selection"
+        if unassigned:
+            summary += f", {len(unassigned)} without a free port ({', '.join(account for account, _ in unassigned)})"
         with self.lock:
-            print(f"All {endpoint} requests have been processed.")
-    
-    def send_cookie_requests(self, filename, ports):
-        """Send cookie data to specified ports"""
-        with open(filename, 'r') as file:
-            lines = file.readlines()
-        
-        cookie_tasks = []
-        
-        for i in range(0, len(lines), 2):
-            if i + 1 < len(lines):
-                user_remark = lines[i].strip()
-                cookie_data = lines[i+1].strip()
-                if i // 2 < len(ports):
-                    port = ports[i // 2]
-                    cookie_tasks.append((port, user_remark, cookie_data))
-        
-        with ThreadPoolExecutor(max_workers=len(cookie_tasks)) as executor:
-            futures = []
-            for port, user_remark, cookie_data in cookie_tasks:
-                url = f"http://{self.config['ip_address']}:{port}/customCookie"
-                headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-                data = {'cookie': cookie_data}
-                futures.append(executor.submit(self.send_request, url, 'post', data, headers))
-                with self.lock:
-                    print(f"Sending data for {user_remark} to port {port}")
-            
-            for future in as_completed(futures):
-                future.result()
-    
-    def process_parallel_config_requests(self, ports, config_data_true_list, config_data_false):
-        """Process config requests in parallel with multithreading"""
-        with ThreadPoolExecutor(max_workers=len(ports) * 2) as executor:
-            futures = []
-            
-            if len(config_data_true_list) == 1:
-                config_data_true = config_data_true_list[0]
-                for port in ports:
-                    url = f"http://{self.config['ip_address']}:{port}/sendSet"
-                    data_true = {'set': config_data_true}
-                    data_false = {'set': config_data_false}
-                    
-                    # Submit true config request
-                    futures.append(executor.submit(self.send_request, url, 'post', data_true))
-                    
-                    # Submit false config request with delay
-                    futures.append(executor.submit(self.send_request, url, 'post', data_false, delay=5))
-            else:
-                config_index = 0
-                port_index = 0
-                while config_index < len(config_data_true_list):
-                    if port_index >= len(ports):
-                        port_index = 0
-                    
-                    url = f"http://{self.config['ip_address']}:{ports[port_index]}/sendSet"
-                    data_true = {'set': config_data_true_list[config_index]}
-                    data_false = {'set': config_data_false}
-                    
-                    # Submit true config request
-                    futures.append(executor.submit(self.send_request, url, 'post', data_true))
-                    
-                    # Submit false config request with delay
-                    futures.append(executor.submit(self.send_request, url, 'post', data_false, delay=5))
-                    
-                    port_index += 1
-                    config_index += 1
-            
-            # Wait for all futures to complete
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                except Exception as exc:
-                    with self.lock:
-                        print(f"Request generated an exception: {exc}") 
\ No newline at end of file
+            print(summary)
+
+    def process_message_cycles(self, cycles, body_false):
+        """Send (port, start, body_true, length) advert cycles at their start offsets, reverting each after its length.
+
+        Each port's cycles are chained in one plan: the next cycle is switched on
+        only after the previous one has been switched off, so an OFF can never
+        overtake the ON of the following cycle.
+        """
+        started = time.monotonic()
+        plans = {}
+        for port, start, body_true, length in sorted(cycles, key=lambda cycle: cycle[1]):
+            turn_off = PlanStep.send(self.send_set_request(port, body_false))
+            plans.setdefault(port, []).extend([
+                PlanStep.wait_until(started + start),
+                PlanStep.send(self.send_set_request(port, body_true), undo=turn_off),
+                PlanStep.wait(length),
+                PlanStep.revert(),
+            ])
+
+        try:
+            self.run_plans(plans.items())
+        except KeyboardInterrupt:
+            # 还没开始的轮次不会再发送，已经开启的在中断时已经恢复
+            pass
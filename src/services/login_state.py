@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from src.utils.atomic_file import write_atomic
+
+def iter_cookie_vault(filename):
+    """Stream (remark, cookie) accounts from the cookie vault without reading it all at once.
+
+    Every account is a remark line followed by its cookie line. Blank lines and
+    lines starting with '#' are ignored. A cookie line without a remark (anything
+    containing '=') is named after its DedeUserID. A remark without a cookie is
+    skipped with a warning.
+    """
+    remark = None
+    with open(filename, 'r', encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if remark is None and '=' in line:
+                yield cookie_account(line), line
+            elif remark is None:
+                remark = line
+            elif '=' in line:
+                yield remark, line
+                remark = None
+            else:
+                print(f"Warning: account '{remark}' has no cookie (line {number}), skipping it.")
+                remark = line
+    if remark is not None:
+        print(f"Warning: account '{remark}' has no cookie, skipping it.")
+
+def cookie_account(cookie):
+    """Name an account after the DedeUserID in its cookie"""
+    for field in cookie.split(';'):
+        key, _, value = field.strip().partition('=')
+        if key == 'DedeUserID' and value:
+            return f"uid {value}"
+    return f"cookie {cookie_hash(cookie)[:8]}"
+
+def cookie_hash(cookie):
+    return hashlib.sha256(cookie.encode('utf-8')).hexdigest()
+
+class LoginState:
+    """Persisted account-to-port assignment and last login result per port.
+
+    Only cookie hashes are stored, never the cookies. The file is read on first
+    use and replaced atomically after every login run. A login older than `ttl`
+    seconds is pushed again, because containers can be restarted behind our back.
+    """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.assignments = None
+        self.ports = None
+        self.dirty = False
+
+    def load(self):
+        if self.assignments is not None:
+            return
+        data = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        self.assignments = data.get('assignments', {})
+        self.ports = data.get('ports', {})
+
+    def save(self):
+        if not self.dirty or not self.path:
+            return
+        self.dirty = False
+        write_atomic(self.path, json.dumps({'assignments': self.assignments, 'ports': self.ports}, indent=4, ensure_ascii=False))
+
+    def plan(self, accounts, ports, force=False):
+        """Decide which ports need a cookie push.
+
+        Accounts keep the port they were assigned before. New accounts take the
+        free ports in order, which matches the old positional mapping on a first
+        run. Accounts that left the vault release their port. Returns
+        (pushes, up_to_date, unassigned, elsewhere), where pushes is a list of
+        (port, account, cookie, cookie_hash) and elsewhere lists the accounts
+        assigned to ports outside `ports`.
+        """
+        with self.lock:
+            self.load()
+            by_key = {str(port): port for port in ports}
+            pushes = []
+            up_to_date = 0
+            pending = []
+            elsewhere = []
+            seen = set()
+
+            for account, cookie in accounts:
+                if account in seen:
+                    print(f"Warning: account '{account}' appears twice in the cookie vault, using the first one.")
+                    continue
+                seen.add(account)
+                key = self.assignments.get(account)
+                if key is None:
+                    pending.append((account, cookie))
+                elif key in by_key:
+                    digest = cookie_hash(cookie)
+                    state = self.ports.get(key, {})
+                    if force or state.get('account') != account or state.get('cookie_hash') != digest or self.expired(state):
+                        pushes.append((by_key[key], account, cookie, digest))
+                    else:
+                        up_to_date += 1
+                else:
+                    elsewhere.append(account)
+
+            for account in [account for account in self.assignments if account not in seen]:
+                self.ports.pop(self.assignments.pop(account), None)
+                self.dirty = True
+
+            taken = set(self.assignments.values())
+            free = [key for key in by_key if key not in taken]
+            for (account, cookie), key in zip(pending, free):
+                self.assignments[account] = key
+                self.dirty = True
+                pushes.append((by_key[key], account, cookie, cookie_hash(cookie)))
+            return pushes, up_to_date, pending[len(free):], elsewhere
+
+    def expired(self, state):
+        """Whether a port's last login failed, or succeeded longer than ttl ago"""
+        if not state.get('ok') or 'last_success' not in state:
+            return True
+        return bool(self.ttl) and time.time() - state['last_success'] > self.ttl
+
+    def forget(self, ports):
+        """Drop the login results of the ports (their assignments are kept), e.g. after their danmuji quit"""
+        with self.lock:
+            self.load()
+            for port in ports:
+                if self.ports.pop(str(port), None) is not None:
+                    self.dirty = True
+
+    def record(self, port, account, digest, ok):
+        with self.lock:
+            state = self.ports.setdefault(str(port), {})
+            state.update(account=account, cookie_hash=digest, ok=ok)
+            self.dirty = True
+            if ok:
+                state['last_success'] = round(time.time(), 3)
+
+    def flush(self):
+        with self.lock:
+            self.save()
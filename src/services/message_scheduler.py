@@ -0,0 +1,117 @@
+import time
+import heapq
+import threading
+
+class TokenBucket:
+    """Per-account send budget: `capacity` messages, refilled at `rate` messages per second"""
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.stamp = time.monotonic() if now is None else now
+
+    def tokens_at(self, when):
+        return min(self.capacity, self.tokens + max(0.0, when - self.stamp) * self.rate)
+
+    def ready_at(self, when):
+        """Earliest time at or after `when` with a whole token available"""
+        missing = 1 - self.tokens_at(when)
+        if missing <= 0:
+            return when
+        return when + missing / self.rate
+
+    def take(self, when):
+        self.tokens = self.tokens_at(when) - 1
+        self.stamp = when
+
+class MessageCycle:
+    """One advert on/off cycle on a port, carrying one or more messages"""
+
+    def __init__(self, port, start):
+        self.port = port
+        self.start = start
+        self.length = 0.0
+        self.messages = []
+
+    def add(self, message, revert_delay, advert_interval):
+        """Add a message; the advert stays on one advert interval longer for each extra message"""
+        self.messages.append(message)
+        self.length = revert_delay + (len(self.messages) - 1) * advert_interval
+
+class MessageScheduler:
+    """Assign -m messages to the earliest-available ports under per-port token buckets.
+
+    Ports sit in a priority queue keyed by the time they can next send. Each
+    message goes to the earliest port. Messages that land on the same port in the
+    same cycle are batched into one advert list, up to `message_batch` per cycle.
+    A cycle stays on for `revert_delay` plus one `advert_interval` (the template's
+    advert.time) per extra message, so every batched message gets posted.
+    Buckets persist between commands (a daemon keeps them), so cooldowns carry over.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.busy_until = {}
+
+    def bucket(self, port, now):
+        bucket = self.buckets.get(port)
+        if bucket is None:
+            bucket = self.buckets[port] = TokenBucket(self.config.get('message_rate', 0.5),
+                                                      self.config.get('message_burst', 3), now)
+        return bucket
+
+    def ready_at(self, port, now):
+        """Earliest time the port has finished its last cycle and has a token"""
+        return self.bucket(port, now).ready_at(max(now, self.busy_until.get(port, now)))
+
+    def finish(self, cycles, now):
+        for cycle in cycles:
+            self.busy_until[cycle.port] = max(self.busy_until.get(cycle.port, now), cycle.start + cycle.length)
+            cycle.start = max(0.0, cycle.start - now)
+        completion = max((cycle.start + cycle.length for cycle in cycles), default=0.0)
+        return cycles, completion
+
+    def broadcast(self, ports, message, revert_delay, advert_interval=0):
+        """Send the same message from every port, each as soon as it is ready"""
+        now = time.monotonic()
+        cycles = []
+        with self.lock:
+            for port in ports:
+                cycle = MessageCycle(port, self.ready_at(port, now))
+                self.bucket(port, now).take(cycle.start)
+                cycle.add(message, revert_delay, advert_interval)
+                cycles.append(cycle)
+            return self.finish(cycles, now)
+
+    def plan(self, ports, messages, revert_delay, advert_interval=0):
+        """Return (cycles, projected completion in seconds); cycle starts are offsets from now"""
+        now = time.monotonic()
+        batch_size = self.config.get('message_batch', 3)
+        with self.lock:
+            queue = []
+            for index, port in enumerate(ports):
+                heapq.heappush(queue, (self.ready_at(port, now), 0, index, port))
+            # 每个端口当前这一轮的广告，以及它的下一轮最早什么时候能开始
+            open_cycles = {}
+            next_cycle = {}
+            cycles = []
+            for message in messages:
+                when, batched, index, port = heapq.heappop(queue)
+                bucket = self.bucket(port, now)
+                cycle = open_cycles.get(port)
+                if cycle is None or cycle.start != when:
+                    cycle = open_cycles[port] = MessageCycle(port, when)
+                    cycles.append(cycle)
+                bucket.take(when)
+                cycle.add(message, revert_delay, advert_interval)
+                next_cycle[port] = when + cycle.length
+
+                if len(cycle.messages) < batch_size and bucket.tokens_at(when) >= 1:
+                    # 同一轮还能再带一条，排在同一时刻的空闲端口之后
+                    heapq.heappush(queue, (when, len(cycle.messages), index, port))
+                else:
+                    heapq.heappush(queue, (bucket.ready_at(next_cycle[port]), 0, index, port))
+            return self.finish(cycles, now)
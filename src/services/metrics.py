@@ -0,0 +1,151 @@
+import time
+import bisect
+import threading
+from urllib.parse import urlsplit, urlencode
+
+class RequestResult:
+    """Outcome of one request to a danmuji port, including retries"""
+
+    OK = 'ok'
+    HTTP_ERROR = 'http_error'
+    CONNECTION_ERROR = 'connection_error'
+    SKIPPED = 'skipped'
+    INVALID = 'invalid'
+
+    def __init__(self, url, method='get', data=None):
+        parts = urlsplit(url)
+        self.url = url
+        self.port = parts.netloc
+        self.endpoint = parts.path.strip('/')
+        self.method = method.upper()
+        self.outcome = None
+        self.status = None
+        self.body = ''
+        self.error = None
+        self.retryable = False
+        self.bytes_sent = self.body_size(data)
+        self.bytes_received = 0
+        self.elapsed = 0.0
+        self.attempts = 1
+        self.timestamp = time.time()
+
+    @staticmethod
+    def body_size(data):
+        if data is None:
+            return 0
+        if isinstance(data, dict):
+            return len(urlencode(data))
+        return len(data)
+
+    @property
+    def ok(self):
+        return self.outcome == self.OK
+
+    @property
+    def message(self):
+        """Human readable line in the format the CLI has always printed"""
+        if self.outcome == self.SKIPPED:
+            text = f"Skipping {self.url}: {self.error}"
+        elif self.outcome == self.INVALID:
+            text = self.error
+        elif self.status is None:
+            text = f"Error connecting to {self.url}: {self.error}"
+        else:
+            text = f"URL: {self.url}, Status Code: {self.status}, Response: {self.body}"
+        if self.attempts > 1:
+            text += f" (after {self.attempts - 1} {'retry' if self.attempts == 2 else 'retries'})"
+        return text
+
+    def to_dict(self):
+        return {
+            'timestamp': round(self.timestamp, 3),
+            'port': self.port,
+            'endpoint': self.endpoint,
+            'method': self.method,
+            'outcome': self.outcome,
+            'status': self.status,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'elapsed_ms': round(self.elapsed * 1000, 3),
+            'attempts': self.attempts,
+            'error': self.error,
+        }
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus bucket layout"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.BUCKETS + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield f'{name}_bucket{{{labels},le="{le}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.total:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+class FleetMetrics:
+    """Request counters and latency histograms per endpoint and per port"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.retries = {}
+        self.bytes = {}
+        self.endpoint_latency = {}
+        self.port_latency = {}
+
+    def record(self, results):
+        """Fold a batch of RequestResults into the metrics"""
+        with self.lock:
+            for result in results:
+                key = (result.endpoint, result.port, result.outcome)
+                self.requests[key] = self.requests.get(key, 0) + 1
+                if result.attempts > 1:
+                    self.retries[result.endpoint] = self.retries.get(result.endpoint, 0) + result.attempts - 1
+                for direction, size in (('sent', result.bytes_sent), ('received', result.bytes_received)):
+                    self.bytes[(result.endpoint, direction)] = self.bytes.get((result.endpoint, direction), 0) + size
+                if result.status is not None:
+                    self.endpoint_latency.setdefault(result.endpoint, Histogram()).observe(result.elapsed)
+                    self.port_latency.setdefault(result.port, Histogram()).observe(result.elapsed)
+
+    def prometheus(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            lines.append('# HELP danmuji_requests_total Requests sent to danmuji ports by outcome.')
+            lines.append('# TYPE danmuji_requests_total counter')
+            for (endpoint, port, outcome), count in sorted(self.requests.items()):
+                lines.append(f'danmuji_requests_total{{endpoint="{endpoint}",port="{port}",outcome="{outcome}"}} {count}')
+
+            lines.append('# HELP danmuji_request_retries_total Retries of idempotent requests.')
+            lines.append('# TYPE danmuji_request_retries_total counter')
+            for endpoint, count in sorted(self.retries.items()):
+                lines.append(f'danmuji_request_retries_total{{endpoint="{endpoint}"}} {count}')
+
+            lines.append('# HELP danmuji_request_bytes_total Request and response body bytes.')
+            lines.append('# TYPE danmuji_request_bytes_total counter')
+            for (endpoint, direction), size in sorted(self.bytes.items()):
+                lines.append(f'danmuji_request_bytes_total{{endpoint="{endpoint}",direction="{direction}"}} {size}')
+
+            lines.append('# HELP danmuji_request_duration_seconds Request latency per endpoint.')
+            lines.append('# TYPE danmuji_request_duration_seconds histogram')
+            for endpoint, histogram in sorted(self.endpoint_latency.items()):
+                lines.extend(histogram.lines('danmuji_request_duration_seconds', f'endpoint="{endpoint}"'))
+
+            lines.append('# HELP danmuji_port_request_duration_seconds Request latency per port.')
+            lines.append('# TYPE danmuji_port_request_duration_seconds histogram')
+            for port, histogram in sorted(self.port_latency.items()):
+                lines.extend(histogram.lines('danmuji_port_request_duration_seconds', f'port="{port}"'))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,70 @@
+import os
+import json
+import threading
+from urllib.parse import quote_plus
+
+class PayloadCompiler:
+    """Compile config templates once into pre-encoded sendSet request bodies"""
+
+    ADVERT_MARKER = '__ADVERT_TEXT__'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._cache = {}
+
+    def _cached(self, config_path, key, build):
+        """Return a cached value for the file, rebuilding it when the file changes"""
+        stat = os.stat(config_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cache_key = (os.path.abspath(config_path), key)
+        with self.lock:
+            entry = self._cache.get(cache_key)
+            if entry and entry[0] == version:
+                return entry[1]
+        value = build()
+        with self.lock:
+            self._cache[cache_key] = (version, value)
+        return value
+
+    @staticmethod
+    def encode_body(config_data):
+        """Form-encode a config dict as a compact sendSet body"""
+        return b'set=' + quote_plus(json.dumps(config_data, separators=(',', ':'))).encode('ascii')
+
+    def load(self, config_path):
+        """Load and parse a configuration template"""
+        def read():
+            with open(config_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        return self._cached(config_path, 'template', read)
+
+    def compile(self, config_path):
+        """Return the pre-encoded sendSet body for a configuration file"""
+        return self._cached(config_path, 'body', lambda: self.encode_body(self.load(config_path)))
+
+    def _split_advert(self, config_path, is_enabled):
+        """Encode the template around a marker so advert text can be spliced in"""
+        config_data = json.loads(json.dumps(self.load(config_path)))
+        if 'advert' not in config_data:
+            return self.encode_body(config_data), None
+
+        config_data['advert']['is_open'] = is_enabled
+        if 'adverts' not in config_data['advert']:
+            return self.encode_body(config_data), None
+
+        config_data['advert']['adverts'] = self.ADVERT_MARKER
+        body = self.encode_body(config_data)
+        prefix, marker, suffix = body.partition(self.ADVERT_MARKER.encode('ascii'))
+        if not marker or self.ADVERT_MARKER.encode('ascii') in suffix:
+            raise ValueError(f"Template {config_path} already contains {self.ADVERT_MARKER}")
+        return prefix, suffix
+
+    def compile_advert(self, config_path, advert_text, is_enabled):
+        """Return a sendSet body with the advert text and switch applied"""
+        prefix, suffix = self._cached(config_path, ('advert', is_enabled),
+                                      lambda: self._split_advert(config_path, is_enabled))
+        if suffix is None:
+            return prefix
+        # Escape the text as a JSON string body, then form-encode it like the rest
+        encoded_text = quote_plus(json.dumps(advert_text)[1:-1]).encode('ascii')
+        return prefix + encoded_text + suffix
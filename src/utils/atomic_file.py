@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+def file_mode(path):
+    """Permissions for path: those of the existing file, or 0666 minus the umask for a new one"""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def write_atomic(path, text):
+    """Write text to a temp file next to path, then move it over path in one step"""
+    directory = os.path.dirname(os.path.abspath(path))
+    name = os.path.basename(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+    try:
+        # mkstemp creates the file as 0600, keep the permissions the file had
+        os.fchmod(fd, file_mode(path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise